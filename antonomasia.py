@@ -1,26 +1,42 @@
-import numpy as np
-import pickle
 import argparse
-import csv
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
 from antonomasia.embeddings import KGE, WordEmbedding, MetaEmbedding
 from antonomasia.generation import AntonomasiaGenerator
 from antonomasia.verbalizer import Verbalizer
-from antonomasia.utils import Sample, get_sample
+from antonomasia.neighbours import NeighbourTable, ReverseIndex, config_key
+from antonomasia.search import ShardedSearch
+from antonomasia.daemon import DaemonClient, model_spec
+from antonomasia.utils import Sample, get_sample, get_samples, get_classes, load_pool
 
 argparser = argparse.ArgumentParser(description="Generate a Vossian Antonomasia")
 argparser.add_argument("-b", "--b_pool", required=True, help="Path to the file containing the csv for the set of B entities.")
-argparser.add_argument("-a", required=True, help="A entity expressed as Wikidata ID - e.g. Q76.")
+a_group = argparser.add_mutually_exclusive_group(required=True)
+a_group.add_argument("-a", help="A entity expressed as Wikidata ID - e.g. Q76.")
+a_group.add_argument("--batch", help="File with one A entity per line, or - for stdin. Results are written as JSON lines.")
+a_group.add_argument("--reverse", help="B entity expressed as Wikidata ID, to list the A entities that it describes. Requires --index.")
+argparser.add_argument("--workers", default=8, type=int, help="Number of threads verbalizing the sentences in batch mode.")
 argparser.add_argument("--num", required=False, default=10, type=int, help="Number of sentences to generate.")
 argparser.add_argument("--confidence", action="store_true", default=False, help="Add a confidence score to each generated sentence.")
 argparser.add_argument("--distance", default="cosine", type=str, choices=["cosine", "euclidean"], help="Vector distance to use.")
 argparser.add_argument("--funny-first", action="store_true", default=False)
+argparser.add_argument("--context", default=["P106"], type=lambda s: s.split(","), help="Comma separated Wikidata IDs of the context predicates, e.g. P106,P101,P136.")
+argparser.add_argument("--table", default=None, help="Path to a neighbour table built with precompute.py, used before falling back to a live search.")
+argparser.add_argument("--index", default=None, help="Path to a reverse index built with precompute.py --reverse.")
+argparser.add_argument("--no-daemon", action="store_true", default=False, help="Load the embeddings in this process even if a daemon is running.")
 
 subparsers = argparser.add_subparsers(dest="method", help="Method specific parameters", required=True)
 
 subparsers_kge = subparsers.add_parser("kge", help="Use Knowledge Graph Embeddings")
 subparsers_kge.add_argument("-i", "--input", required=True, help="Path to the KGE weigths.")
 subparsers_kge.add_argument("-p", "--projection", required=True, help="Projection method to use.", choices=["translate", "project"])
+subparsers_kge.add_argument("--entities", default=None, help="Draw B from all the KGE entities, memory-mapping their embeddings from this .npy file (created if missing).")
+subparsers_kge.add_argument("--processes", default=None, type=int, help="Number of processes searching the entities, defaults to all cores.")
+subparsers_kge.add_argument("--allowed", default=None, help="File with the Wikidata IDs of the entities that can be used as B with --entities, one per line.")
 
 subparsers_kge = subparsers.add_parser("we", help="Use Word Embeddings")
 subparsers_kge.add_argument("-m", "--model", required=True, help="Word embedding method to use.", choices=["word2vec", "glove"])
@@ -32,44 +48,260 @@ subparsers_kge.add_argument("-we", required=True, help="Word embedding method to
 subparsers_kge.add_argument("-p", "--projection", required=True, help="Projection method to use.", choices=["translate", "project"])
 subparsers_kge.add_argument("-c", "--combination", required=True, help="Combination method to use.", choices=["concatenate", "average"])
 
-if __name__ == "__main__":
-    args = argparser.parse_args()
-    
-    with open(args.b_pool, "r", encoding="utf-8") as csvfile:
-        csv_reader = csv.reader(csvfile)
-        pool_of_b = [Sample(row[0].split("/")[-1], row[1], row[-1].split("_")) for row in csv_reader]
 
+def method_name(args) -> str:
     if args.method == "kge":
-        emb = KGE(args.input)
+        return "kge"
     elif args.method == "we":
-        emb = WordEmbedding(args.model)
-    elif args.method == "meta":
-        kge = KGE(args.kge)
-        we = WordEmbedding(args.we)
-        emb = MetaEmbedding(we, kge, method=args.combination)
+        return args.model
+    we = "w2v" if args.we == "word2vec" else "glove"
+    combination = "conc" if args.combination == "concatenate" else "average"
+    return f"meta_{we}_{combination}"
+
+
+def method_spec(args) -> Dict[str, str]:
+    if args.method == "kge":
+        return model_spec("kge", kge=args.input)
+    elif args.method == "we":
+        return model_spec("we", we=args.model)
+    return model_spec("meta", kge=args.kge, we=args.we, combination=args.combination)
+
+
+class Generation(object):
+    def __init__(self, args, pool_of_b: List[Sample]):
+        """
+        Search state shared by all the A entities of a run.
+        Embeddings are only loaded when an A cannot be answered by the neighbour table,
+        nor by a daemon started with `python -m antonomasia.daemon`.
+        """
+        self.args = args
+        self.pool_of_b = pool_of_b
+        self.contexts = args.context
+        self.table = NeighbourTable(args.table, pool_of_b) if args.table is not None else None
+        self.generator = None
+        self.sharded = None
+        self.daemon = None
+        if not args.no_daemon and getattr(args, "entities", None) is None:
+            client = DaemonClient()
+            if client.available():
+                self.daemon = client
+
+    def _load(self):
+        args = self.args
+        if args.method == "kge":
+            emb = KGE(args.input)
+        elif args.method == "we":
+            emb = WordEmbedding(args.model)
+        elif args.method == "meta":
+            kge = KGE(args.kge)
+            we = WordEmbedding(args.we)
+            emb = MetaEmbedding(we, kge, method=args.combination)
+        self.generator = AntonomasiaGenerator(emb, self.pool_of_b, resolve=get_samples)
+
+        if args.method == "kge" and args.entities is not None:
+            allowed_iris = None
+            if args.allowed is not None:
+                with open(args.allowed, "r", encoding="utf-8") as f:
+                    allowed_iris = [line.strip() for line in f if line.strip()]
+            # the classes of the entities outside of the pool are looked up on Wikidata
+            self.sharded = ShardedSearch.from_kge(emb, args.entities, allowed_iris=allowed_iris,
+                                                  processes=args.processes, resolve=get_samples,
+                                                  classes={ b.wikidata_iri: b.classes for b in self.pool_of_b },
+                                                  labels={ b.wikidata_iri: b.label for b in self.pool_of_b })
+
+    def search(self, a: str) -> Tuple[Sample, Dict[str, List[Tuple[Sample, float]]]]:
+        """
+        Retrieve the top Bs of an A entity for every context.
+        Contexts for which A has no value cannot be verbalized, hence they are
+        left out of the results, see ~antonomasia.utils.get_classes.
+        """
+        args = self.args
+        a_sample = get_sample(a, self.contexts[0])
+        a_classes = {self.contexts[0]: a_sample.classes}
+        if len(self.contexts) > 1:
+            a_classes.update(get_classes(a, self.contexts[1:]))
+        contexts = [c for c in self.contexts if a_classes[c]]
+        if not contexts:
+            return a_sample, {}
+        # the classes excluded by a single context search are the ones of the sample
+        query = a_sample._replace(classes=a_classes[contexts[0]])
+        a_classes = { c: a_classes[c] for c in contexts }
+
+        if self.table is not None and len(contexts) == 1:
+            config = config_key(method_name(args), args.projection, args.distance)
+            # the table only serves A with the classes it has in the pool
+            found = self.table.lookup(a, config, k=args.num, context=contexts[0], magnitude_sort=args.funny_first,
+                                      a_classes=query.classes)
+            if found is not None:
+                return a_sample, {contexts[0]: found}
+
+        if self.daemon is not None:
+            try:
+                results = self.daemon.generate(method_spec(args), args.b_pool, query, contexts, a_classes,
+                                               projection=args.projection, k=args.num,
+                                               magnitude_sort=args.funny_first, similarity_fn=args.distance)
+                return a_sample, results
+            except ConnectionError:
+                # the daemon stopped, e.g. after its idle timeout
+                self.daemon = None
+
+        if self.generator is None:
+            self._load()
+        generator = self.generator
+
+        if self.sharded is not None:
+            results = self.sharded.top_k_contexts(query, contexts, a_classes, projection=args.projection, k=args.num,
+                                                  magnitude_sort=args.funny_first, similarity_fn=args.distance)
+        elif len(contexts) == 1:
+            results = {contexts[0]: generator.generate(query, contexts[0], projection=args.projection, k=args.num,
+                                                       magnitude_sort=args.funny_first, similarity_fn=args.distance)}
+        else:
+            results = generator.top_k_contexts(query, contexts, a_classes, projection=args.projection, k=args.num,
+                                               magnitude_sort=args.funny_first, similarity_fn=args.distance)
+        return a_sample, results
+
+    def missing(self, results: Dict[str, List[Tuple[Sample, float]]]) -> List[str]:
+        """
+        Contexts left out of the results of ~search.
+        """
+        return [c for c in self.contexts if c not in results]
+
+    def close(self):
+        if self.sharded is not None:
+            self.sharded.close()
 
-    generator = AntonomasiaGenerator(emb, pool_of_b)
+
+def error_record(a: str, stage: str, e: Exception, **kwargs) -> dict:
+    return {"a": a, "stage": stage, "error": type(e).__name__, "message": str(e), **kwargs}
+
+
+def run_batch(generation: Generation, ids, out, workers: int = 8):
+    """
+    Generate the sentences of several A entities.
+    The search of the next A runs while the sentences of the previous ones are
+    verbalized by a pool of threads, and every sentence is written as a JSON line
+    as soon as it is ready. Failures are written as records with an "error" field.
+    """
+    lock = threading.Lock()
+    # bound the number of pending sentences, so that the search cannot run too far ahead
+    pending = threading.BoundedSemaphore(4 * workers)
+    local = threading.local()
+
+    def write(record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with lock:
+            out.write(line + "\n")
+            out.flush()
+
+    def verbalize(a_sample: Sample, context: str, rank: int, b: Sample, conf: float):
+        try:
+            if not hasattr(local, "verb"):
+                local.verb = Verbalizer()
+            sentence = local.verb.generate_sentence(a_sample, b, context)
+            write({"a": a_sample.wikidata_iri, "context": context, "rank": rank, "b": b.wikidata_iri,
+                   "confidence": float(conf), "sentence": sentence})
+        except Exception as e:
+            write(error_record(a_sample.wikidata_iri, "verbalization", e, context=context, rank=rank, b=b.wikidata_iri))
+        finally:
+            pending.release()
+
+    with ThreadPoolExecutor(workers) as executor:
+        for line in ids:
+            a = line.strip()
+            if not a:
+                continue
+            try:
+                a_sample, results = generation.search(a)
+            except Exception as e:
+                write(error_record(a, "search", e))
+                continue
+            for context in generation.missing(results):
+                write(error_record(a, "search", ValueError(f"{a} has no value for {context}"), context=context))
+            for context, found in results.items():
+                if not found:
+                    write(error_record(a, "search", LookupError(f"No B found for {a} along {context}"), context=context))
+                for rank, (b, conf) in enumerate(found):
+                    pending.acquire()
+                    executor.submit(verbalize, a_sample, context, rank, b, conf)
+
+
+def run_reverse(args, pool_of_b: List[Sample]):
+    """
+    Print the sentences describing an A entity by the B entity of args.reverse.
+    Sentences that cannot be verbalized are reported on stderr, and the exit status is non-zero.
+    """
+    context = args.context[0]
+    config = config_key(method_name(args), args.projection, args.distance)
+    found = ReverseIndex(args.index, pool_of_b).lookup(args.reverse, config, k=args.num, context=context)
+    if found is None:
+        print(f"The index cannot answer for {args.reverse}, it may have to be rebuilt.", file=sys.stderr)
+        sys.exit(1)
+
+    b_sample = next(b for b in pool_of_b if b.wikidata_iri == args.reverse)
     verb = Verbalizer()
+    failed = 0
+    for a_sample, rank, conf in found:
+        try:
+            sentence = verb.generate_sentence(a_sample, b_sample, context)
+        except Exception as e:
+            print(f"Cannot verbalize {a_sample.wikidata_iri}: {type(e).__name__}: {e}", file=sys.stderr)
+            failed += 1
+            continue
+        if args.confidence:
+            print(f"Confidence: {conf} - ", end="")
+        print(f"{sentence}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = argparser.parse_args()
     
-    profession_pred = "P106"
-    a_sample = get_sample(args.a, profession_pred)
-    
+    pool_of_b = load_pool(args.b_pool)
+
+    if args.reverse is not None:
+        if args.index is None:
+            argparser.error("--reverse requires --index")
+        run_reverse(args, pool_of_b)
+        sys.exit(0)
+
+    generation = Generation(args, pool_of_b)
     try:
-        a_emb, b_emb, b_ids, c_emb = generator.embed_a_b_c(a_sample, profession_pred)
-
-        if args.projection == "translate":
-            a, b = generator.translate_embeddings(a_emb, b_emb, c_emb)
-        elif args.projection == "project":
-            a, b = generator.project_embeddings(a_emb, b_emb, c_emb)
-
-        top_k, sim = generator.top_k(a, b, k=args.num, magnitude_sort=args.funny_first, similarity_fn=args.distance)
-
-        for idx, conf in zip(top_k, sim):
-            b = b_ids[idx]
-            sentence = verb.generate_sentence(a_sample, b, profession_pred)
-            if args.confidence:
-                print(f"Confidence: {conf} - ", end="")
-            print(f"{sentence}")
-    except:
-        # Entity is not available in training set
-        pass
\ No newline at end of file
+        if args.batch is not None:
+            if args.batch == "-":
+                run_batch(generation, sys.stdin, sys.stdout, workers=args.workers)
+            else:
+                with open(args.batch, "r", encoding="utf-8") as ids:
+                    run_batch(generation, ids, sys.stdout, workers=args.workers)
+        else:
+            try:
+                a_sample, results = generation.search(args.a)
+            except Exception as e:
+                print(f"Cannot generate a Vossian Antonomasia for {args.a}: {type(e).__name__}: {e}", file=sys.stderr)
+                sys.exit(1)
+
+            for context in generation.missing(results):
+                print(f"{args.a} has no value for {context}, no sentence can be generated along it.", file=sys.stderr)
+            if not results:
+                sys.exit(1)
+
+            verb = Verbalizer()
+            failed = 0
+            for context, found in results.items():
+                if not found:
+                    print(f"No B found for {args.a} along {context}.", file=sys.stderr)
+                    failed += 1
+                for b, conf in found:
+                    try:
+                        sentence = verb.generate_sentence(a_sample, b, context)
+                    except Exception as e:
+                        print(f"Cannot verbalize {b.wikidata_iri} along {context}: {type(e).__name__}: {e}", file=sys.stderr)
+                        failed += 1
+                        continue
+                    if args.confidence:
+                        print(f"Confidence: {conf} - ", end="")
+                    print(f"{sentence}")
+            if failed:
+                sys.exit(1)
+    finally:
+        generation.close()
@@ -0,0 +1,210 @@
+from typing import Callable, Dict, Hashable, Optional
+from collections import OrderedDict
+import functools
+import os
+import threading
+import numpy as np
+
+_cache = None
+
+
+class EmbeddingCache(object):
+
+  def __init__(self, max_bytes: int = 64 * 2**20, path: Optional[str] = None):
+    """
+    Least recently used cache of the entity and predicate embeddings, keyed by
+    the name of the embedding method and the Wikidata IRI.
+    The cache is bounded by the size of the stored vectors rather than by their number,
+    since the vectors of a meta-embedding are larger than the ones of a single method.
+
+    Predicate labels and embeddings are few and expensive to compute, as the labels
+    are fetched from Wikidata, hence they can be persisted to disk and are never evicted.
+
+    Args:
+        max_bytes (int, optional): Maximum size of the cached entity embeddings. Defaults to 64MiB.
+        path (Optional[str], optional): File persisting the predicate labels and embeddings.
+          Defaults to None, i.e. nothing is persisted.
+    """
+    self.max_bytes = max_bytes
+    self.path = path
+    self.nbytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._entities = OrderedDict()
+    self._predicates = {}
+    self._labels = {}
+    self._lock = threading.Lock()
+
+    if path is not None and os.path.exists(path):
+      import pickle
+
+      with open(path, "rb") as f:
+        content = pickle.load(f)
+      self._predicates = content["predicates"]
+      self._labels = content["labels"]
+
+  def _lookup(self, store: Dict, key: Hashable):
+    with self._lock:
+      if key in store:
+        self.hits += 1
+        if store is self._entities:
+          store.move_to_end(key)
+        return store[key]
+      self.misses += 1
+      return None
+
+  def entity(self, namespace: str, iri: Hashable, compute: Callable[[], np.array]) -> np.array:
+    """
+    Retrieve the embedding of an entity, computing it on a miss.
+    The returned vector is read-only, as it is shared by all the callers.
+
+    Args:
+        namespace (str): Name of the embedding method.
+        iri (Hashable): Wikidata IRI of the entity, paired with its label for the
+          methods embedding the label, see ~cached.
+        compute (Callable[[], np.array]): Compute the embedding.
+
+    Returns:
+        np.array: Embedding vector.
+    """
+    key = (namespace, iri)
+    emb = self._lookup(self._entities, key)
+    if emb is not None:
+      return emb
+
+    emb = np.asarray(compute())
+    emb.flags.writeable = False
+    if emb.nbytes > self.max_bytes:
+      return emb
+
+    with self._lock:
+      if key not in self._entities:
+        self._entities[key] = emb
+        self.nbytes += emb.nbytes
+      while self.nbytes > self.max_bytes:
+        _, evicted = self._entities.popitem(last=False)
+        self.nbytes -= evicted.nbytes
+        self.evictions += 1
+    return emb
+
+  def predicate(self, namespace: str, iri: str, compute: Callable[[], np.array]) -> np.array:
+    """
+    Retrieve the embedding of a predicate, computing it on a miss, see ~entity.
+    """
+    key = (namespace, iri)
+    emb = self._lookup(self._predicates, key)
+    if emb is None:
+      emb = np.asarray(compute())
+      emb.flags.writeable = False
+      with self._lock:
+        self._predicates[key] = emb
+      self._save()
+    return emb
+
+  def label(self, iri: str, fetch: Callable[[], str]) -> str:
+    """
+    Retrieve the label of a Wikidata entity, fetching it on a miss.
+
+    Args:
+        iri (str): Wikidata IRI.
+        fetch (Callable[[], str]): Fetch the label.
+
+    Returns:
+        str: The label.
+    """
+    label = self._lookup(self._labels, iri)
+    if label is None:
+      label = fetch()
+      with self._lock:
+        self._labels[iri] = label
+      self._save()
+    return label
+
+  def _save(self):
+    if self.path is None:
+      return
+    import pickle
+
+    with self._lock:
+      content = {"predicates": dict(self._predicates), "labels": dict(self._labels)}
+    # write to a temporary file first, so that a crash never leaves a corrupted cache
+    tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+      pickle.dump(content, f)
+    os.replace(tmp, self.path)
+
+  def stats(self) -> Dict[str, float]:
+    """
+    Usage statistics of the cache.
+
+    Returns:
+        Dict[str, float]: Number of hits, misses and evictions, hit rate, number
+          of cached entities and predicates, and size of the entity embeddings.
+    """
+    with self._lock:
+      lookups = self.hits + self.misses
+      return {
+        "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+        "hit_rate": self.hits / lookups if lookups else 0.0,
+        "entities": len(self._entities), "predicates": len(self._predicates), "labels": len(self._labels),
+        "nbytes": self.nbytes, "max_bytes": self.max_bytes,
+      }
+
+  def clear(self):
+    """
+    Drop the cached entity embeddings and reset the statistics.
+    Persisted predicates and labels are kept.
+    """
+    with self._lock:
+      self._entities.clear()
+      self.nbytes = self.hits = self.misses = self.evictions = 0
+
+
+def get_cache() -> EmbeddingCache:
+  """
+  Cache shared by all the embedding methods. It can be configured with the
+  ANTONOMASIA_CACHE_BYTES and ANTONOMASIA_CACHE_PATH environment variables, or
+  replaced with ~set_cache.
+
+  Returns:
+      EmbeddingCache: The shared cache.
+  """
+  global _cache
+  if _cache is None:
+    _cache = EmbeddingCache(int(os.environ.get("ANTONOMASIA_CACHE_BYTES", 64 * 2**20)),
+                            os.environ.get("ANTONOMASIA_CACHE_PATH"))
+  return _cache
+
+
+def set_cache(cache: EmbeddingCache):
+  """
+  Replace the cache shared by all the embedding methods.
+
+  Args:
+      cache (EmbeddingCache): The new cache.
+  """
+  global _cache
+  _cache = cache
+
+
+def cached(kind: str, by_label: bool = False):
+  """
+  Cache the embed_entity or embed_predicate method of an embedding method in the
+  shared cache, under the name of the method (see ~BaseEmbedding.name).
+
+  Args:
+      kind (str): Either "entity" or "predicate".
+      by_label (bool, optional): The entity embedding is computed from the label, which is then
+        part of the key, so that a relabelled entity is embedded again. Defaults to False.
+  """
+  def decorator(fn):
+    @functools.wraps(fn)
+    def wrapper(self, s):
+      if kind == "predicate":
+        iri = s
+      else:
+        iri = (s.wikidata_iri, s.label) if by_label else s.wikidata_iri
+      return getattr(get_cache(), kind)(self.name, iri, lambda: fn(self, s))
+    return wrapper
+  return decorator
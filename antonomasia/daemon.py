@@ -0,0 +1,433 @@
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+from antonomasia.cache import get_cache
+from antonomasia.embeddings import BaseEmbedding, KGE, WordEmbedding, MetaEmbedding
+from antonomasia.generation import AntonomasiaGenerator
+from antonomasia.models import model_nbytes
+from antonomasia.utils import Sample, get_samples, load_pool
+
+
+def default_socket() -> str:
+  """
+  Path of the Unix domain socket of the daemon, which can be set with
+  the ANTONOMASIA_SOCKET environment variable.
+
+  Returns:
+      str: Path to the socket.
+  """
+  default = os.path.join(tempfile.gettempdir(), f"antonomasia-{os.getuid()}.sock")
+  return os.environ.get("ANTONOMASIA_SOCKET", default)
+
+
+def _rss() -> int:
+  """
+  Resident memory of the process in bytes, 0 if it cannot be measured.
+  """
+  try:
+    with open("/proc/self/statm") as f:
+      return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except (OSError, ValueError):
+    return 0
+
+
+class ModelDaemon(object):
+
+  def __init__(self, path: Optional[str] = None, idle_timeout: float = 600):
+    """
+    Keep embedding methods loaded between invocations of antonomasia.py.
+    Requests are JSON lines received on a Unix domain socket, see ~DaemonClient.
+    The daemon stops after idle_timeout seconds without requests.
+
+    Args:
+        path (Optional[str], optional): Path to the socket. Defaults to ~default_socket.
+        idle_timeout (float, optional): Seconds without requests before shutting down. Defaults to 600.
+    """
+    self.path = path or default_socket()
+    self.idle_timeout = idle_timeout
+    self.models = {}
+    self.generators = {}
+    # short critical sections only: loading a model can take minutes, hence every
+    # model and generator is built under its own lock, see ~_key_lock
+    self._lock = threading.Lock()
+    self._loading = {}
+    self._active_lock = threading.Lock()
+    self._active = 0
+    self._last_request = time.monotonic()
+    self._server = None
+
+  def _key_lock(self, key: tuple) -> threading.Lock:
+    with self._lock:
+      return self._loading.setdefault(key, threading.Lock())
+
+  def _model(self, kind: str, name: str) -> BaseEmbedding:
+    key = (kind, name)
+    entry = self.models.get(key)
+    if entry is None:
+      # concurrent requests for the same model wait for a single load
+      with self._key_lock(key):
+        entry = self.models.get(key)
+        if entry is None:
+          rss, start = _rss(), time.monotonic()
+          model = KGE(name) if kind == "kge" else WordEmbedding(name)
+          entry = {
+            "model": model,
+            "load_seconds": time.monotonic() - start,
+            "nbytes": model_nbytes(model),
+            "rss_delta": _rss() - rss,
+            "requests": 0,
+            "last_used": time.time(),
+          }
+          with self._lock:
+            self.models[key] = entry
+    return entry["model"]
+
+  def _touch(self, spec: Dict[str, str]):
+    with self._lock:
+      for kind in ["kge", "we"]:
+        if kind in spec and (kind, spec[kind]) in self.models:
+          entry = self.models[(kind, spec[kind])]
+          entry["requests"] += 1
+          entry["last_used"] = time.time()
+
+  def embedding(self, spec: Dict[str, str]) -> BaseEmbedding:
+    """
+    Retrieve an embedding method, loading it on first use.
+    Meta-embeddings share the KGE and word embeddings loaded for other requests.
+
+    Args:
+        spec (Dict[str, str]): Description of the method, see ~model_spec.
+
+    Returns:
+        BaseEmbedding: The embedding method.
+    """
+    if spec["method"] == "kge":
+      return self._model("kge", spec["kge"])
+    elif spec["method"] == "we":
+      return self._model("we", spec["we"])
+    elif spec["method"] == "meta":
+      return MetaEmbedding(self._model("we", spec["we"]), self._model("kge", spec["kge"]), method=spec["combination"])
+    raise ValueError(f"{spec['method']} is not a supported embedding method!")
+
+  def generator(self, spec: Dict[str, str], b_pool: str) -> AntonomasiaGenerator:
+    """
+    Retrieve the generator of an embedding method over a pool of B.
+    When the pool file changes, the generator is updated in place with the
+    added, removed and changed candidates, see ~AntonomasiaGenerator.update_b,
+    so that the entries which did not change are not embedded again.
+
+    Args:
+        spec (Dict[str, str]): Description of the method, see ~model_spec.
+        b_pool (str): Path to the csv of the pool of B.
+
+    Returns:
+        AntonomasiaGenerator: The generator.
+    """
+    key = (tuple(sorted(spec.items())), b_pool)
+    mtime = os.path.getmtime(b_pool)
+    with self._key_lock(("generator",) + key):
+      entry = self.generators.get(key)
+      if entry is None:
+        pool = load_pool(b_pool)
+        entry = {"generator": AntonomasiaGenerator(self.embedding(spec), pool, resolve=get_samples), "pool": pool, "mtime": mtime}
+        with self._lock:
+          self.generators[key] = entry
+      elif entry["mtime"] != mtime:
+        pool = load_pool(b_pool)
+        self._reload(entry["generator"], entry["pool"], pool)
+        entry.update(pool=pool, mtime=mtime)
+      return entry["generator"]
+
+  @staticmethod
+  def _reload(generator: AntonomasiaGenerator, old: List[Sample], new: List[Sample]):
+    old = { b.wikidata_iri: b for b in old }
+    new = { b.wikidata_iri: b for b in new }
+    generator.remove_b([iri for iri in old if iri not in new])
+    changed = [b for iri, b in new.items() if iri not in old or old[iri].label != b.label or old[iri].classes != b.classes]
+    if changed:
+      generator.update_b(changed)
+
+  def status(self) -> dict:
+    """
+    Memory used by every loaded model and generator, and usage of the embedding cache.
+
+    Returns:
+        dict: Memory accounting of the daemon.
+    """
+    with self._lock:
+      loaded, built = list(self.models.items()), list(self.generators.items())
+    models = []
+    for (kind, name), entry in loaded:
+      models.append({
+        "kind": kind, "name": name, "nbytes": entry["nbytes"], "rss_delta": entry["rss_delta"],
+        "load_seconds": entry["load_seconds"], "requests": entry["requests"], "last_used": entry["last_used"],
+      })
+    generators = []
+    for (spec, b_pool), entry in built:
+      generator = entry["generator"]
+      snap = generator.snapshot() if generator._snapshot.b_emb is not None else None
+      generators.append({
+        "model": dict(spec), "b_pool": b_pool, "candidates": len(generator.b_pool),
+        "nbytes": snap.b_emb.nbytes if snap is not None else 0,
+      })
+    return {"pid": os.getpid(), "rss": _rss(), "models": models, "generators": generators, "cache": get_cache().stats()}
+
+  def generate(self, request: dict) -> dict:
+    generator = self.generator(request["model"], request["b_pool"])
+    self._touch(request["model"])
+    a = Sample(*request["a"])
+    contexts = request["contexts"]
+    params = {
+      "projection": request["projection"], "k": request["k"],
+      "magnitude_sort": request["magnitude_sort"], "similarity_fn": request["similarity_fn"],
+    }
+    if len(contexts) == 1:
+      results = {contexts[0]: generator.generate(a, contexts[0], **params)}
+    else:
+      results = generator.top_k_contexts(a, contexts, request.get("a_classes"), **params)
+    return {
+      "results": {
+        c: [[b.wikidata_iri, b.label, list(b.classes), float(conf)] for b, conf in found]
+        for c, found in results.items()
+      }
+    }
+
+  def handle(self, request: dict) -> dict:
+    """
+    Answer a request.
+
+    Args:
+        request (dict): Request with an "op" field among "ping", "status", "generate" and "shutdown".
+
+    Returns:
+        dict: The response, with "error" and "message" fields if the request failed.
+    """
+    try:
+      op = request.get("op")
+      if op == "ping":
+        return {"pid": os.getpid()}
+      elif op == "status":
+        return self.status()
+      elif op == "generate":
+        return self.generate(request)
+      elif op == "shutdown":
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+        return {}
+      raise ValueError(f"{op} is not a supported operation!")
+    except Exception as e:
+      return {"error": type(e).__name__, "message": str(e)}
+
+  def _watch_idle(self):
+    while True:
+      time.sleep(min(self.idle_timeout, 1))
+      if self._active == 0 and time.monotonic() - self._last_request > self.idle_timeout:
+        self._server.shutdown()
+        return
+
+  def serve(self):
+    """
+    Listen on the socket until shut down or idle for too long.
+    The socket is only accessible by the user running the daemon.
+
+    Raises:
+        RuntimeError: If another daemon is listening, or if the socket belongs to another user.
+    """
+    if os.path.lexists(self.path):
+      # the default path is predictable, a socket of another user could serve anything
+      if os.lstat(self.path).st_uid != os.getuid():
+        raise RuntimeError(f"{self.path} is owned by another user")
+      if DaemonClient(self.path).available():
+        raise RuntimeError(f"a daemon is already listening on {self.path}")
+      # left behind by a daemon that did not stop cleanly
+      os.unlink(self.path)
+
+    daemon = self
+
+    class Handler(socketserver.StreamRequestHandler):
+      def handle(self):
+        with daemon._active_lock:
+          daemon._active += 1
+        try:
+          line = self.rfile.readline()
+          response = daemon.handle(json.loads(line)) if line else {}
+          self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+        finally:
+          with daemon._active_lock:
+            daemon._active -= 1
+            daemon._last_request = time.monotonic()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+      daemon_threads = True
+
+    # only the owner can connect, since requests make the daemon load arbitrary model files
+    umask = os.umask(0o177)
+    try:
+      server = Server(self.path, Handler)
+    finally:
+      os.umask(umask)
+    os.chmod(self.path, 0o600)
+
+    with server:
+      self._server = server
+      threading.Thread(target=self._watch_idle, daemon=True).start()
+      try:
+        server.serve_forever()
+      finally:
+        os.unlink(self.path)
+
+
+class DaemonClient(object):
+
+  def __init__(self, path: Optional[str] = None, timeout: Optional[float] = None):
+    """
+    Send requests to a ~ModelDaemon.
+
+    Args:
+        path (Optional[str], optional): Path to the socket. Defaults to ~default_socket.
+        timeout (Optional[float], optional): Socket timeout in seconds. Defaults to None.
+    """
+    self.path = path or default_socket()
+    self.timeout = timeout
+
+  def request(self, request: dict) -> dict:
+    """
+    Send a request and wait for its response.
+
+    Args:
+        request (dict): The request, see ~ModelDaemon.handle.
+
+    Raises:
+        ConnectionError: If no daemon is listening, or if the socket belongs to another user.
+        RuntimeError: If the daemon could not answer the request.
+
+    Returns:
+        dict: The response.
+    """
+    if not hasattr(socket, "AF_UNIX"):
+      raise ConnectionError("Unix domain sockets are not supported on this platform")
+    try:
+      if os.lstat(self.path).st_uid != os.getuid():
+        raise ConnectionError(f"{self.path} is owned by another user")
+    except FileNotFoundError as e:
+      raise ConnectionError(f"no daemon is listening on {self.path}") from e
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+      s.settimeout(self.timeout)
+      try:
+        s.connect(self.path)
+      except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise ConnectionError(f"no daemon is listening on {self.path}") from e
+      s.sendall((json.dumps(request) + "\n").encode("utf-8"))
+      with s.makefile("rb") as f:
+        line = f.readline()
+    if not line:
+      raise ConnectionError(f"the daemon on {self.path} closed the connection")
+
+    response = json.loads(line)
+    if "error" in response:
+      raise RuntimeError(f"{response['error']}: {response['message']}")
+    return response
+
+  def available(self, timeout: float = 1) -> bool:
+    """
+    Check whether a daemon is listening.
+
+    Args:
+        timeout (float, optional): Seconds to wait for the answer, so that an unresponsive
+          daemon is treated as absent. Defaults to 1.
+
+    Returns:
+        bool: True if the daemon answered.
+    """
+    try:
+      DaemonClient(self.path, timeout).request({"op": "ping"})
+      return True
+    except (ConnectionError, OSError):
+      return False
+
+  def generate(self, model: Dict[str, str], b_pool: str, a: Sample, contexts: List[str],
+               a_classes: Optional[Dict[str, List[str]]] = None,
+               projection: str = "translate",
+               k: int = 10,
+               magnitude_sort: bool = False,
+               similarity_fn: str = "cosine") -> Dict[str, List[Tuple[Sample, float]]]:
+    """
+    Retrieve the top-k B of a for every context, see ~AntonomasiaGenerator.top_k_contexts.
+
+    Args:
+        model (Dict[str, str]): Description of the embedding method, see ~model_spec.
+        b_pool (str): Path to the csv of the pool of B.
+        a (Sample): Entity a sample
+        contexts (List[str]): Predicates for c.
+        a_classes (Optional[Dict[str, List[str]]], optional): Classifying features of a
+          for each context. Defaults to a.classes for every context.
+        projection (str, optional): Either "translate" or "project". Defaults to "translate".
+        k (int, optional): Number of top results per context. Defaults to 10.
+        magnitude_sort (bool, optional): See ~AntonomasiaGenerator.top_k. Defaults to False.
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+    Returns:
+        Dict[str, List[Tuple[Sample, float]]]: The Bs together with their score for each context.
+    """
+    response = self.request({
+      "op": "generate", "model": model, "b_pool": os.path.abspath(b_pool),
+      "a": [a.wikidata_iri, a.label, list(a.classes)], "contexts": contexts,
+      "a_classes": { c: list(v) for c, v in a_classes.items() } if a_classes else None,
+      "projection": projection, "k": k, "magnitude_sort": magnitude_sort, "similarity_fn": similarity_fn,
+    })
+    return {
+      c: [(Sample(iri, label, classes), conf) for iri, label, classes, conf in found]
+      for c, found in response["results"].items()
+    }
+
+
+def model_spec(method: str, kge: Optional[str] = None, we: Optional[str] = None,
+               combination: Optional[str] = None) -> Dict[str, str]:
+  """
+  Describe an embedding method so that the daemon can load it.
+
+  Args:
+      method (str): Either "kge", "we" or "meta".
+      kge (Optional[str], optional): Path to the KGE weigths. Defaults to None.
+      we (Optional[str], optional): Word embedding method. Defaults to None.
+      combination (Optional[str], optional): Combination method of the meta-embedding. Defaults to None.
+
+  Returns:
+      Dict[str, str]: Description of the method.
+  """
+  spec = {"method": method}
+  if kge is not None:
+    spec["kge"] = os.path.abspath(kge)
+  if we is not None:
+    spec["we"] = we
+  if combination is not None:
+    spec["combination"] = combination
+  return spec
+
+
+argparser = argparse.ArgumentParser(description="Keep embedding models loaded for antonomasia.py")
+argparser.add_argument("--socket", default=None, help="Path to the Unix domain socket.")
+argparser.add_argument("--idle-timeout", default=600, type=float, help="Seconds without requests before shutting down.")
+argparser.add_argument("--status", action="store_true", default=False, help="Print the memory used by a running daemon.")
+argparser.add_argument("--stop", action="store_true", default=False, help="Stop a running daemon.")
+
+if __name__ == "__main__":
+  args = argparser.parse_args()
+
+  if args.status or args.stop:
+    try:
+      response = DaemonClient(args.socket).request({"op": "status" if args.status else "shutdown"})
+    except ConnectionError as e:
+      print(e, file=sys.stderr)
+      sys.exit(1)
+    if args.status:
+      print(json.dumps(response, indent=2))
+  else:
+    ModelDaemon(args.socket, idle_timeout=args.idle_timeout).serve()
@@ -1,14 +1,12 @@
 import abc
+import os
 
-from typing import Tuple, Dict
-from functools import lru_cache
+from typing import Tuple, Dict, Optional
 import numpy as np
-import pickle
-import gensim.downloader
 
-from wikidata.client import Client
-
-from antonomasia.utils import Sample
+from antonomasia.cache import cached, get_cache
+from antonomasia.quantization import quantize
+from antonomasia.utils import Sample, get_client
 
 class BaseEmbedding(abc.ABC):
   """
@@ -18,9 +16,10 @@ class BaseEmbedding(abc.ABC):
 
   The methods embed_entity and embed_predicate are used to retrieve the
   emebddings of an entity and a predicate, respectively.
+  Subclasses caching them with ~antonomasia.cache.cached set the attribute name,
+  which identifies the method and its weights in the cache.
   """
 
-  @lru_cache(maxsize=100)
   def __contains__(self, s: Sample) -> bool:
     """
     Check wether the embedding method includes the provided identifier.
@@ -32,7 +31,6 @@ class BaseEmbedding(abc.ABC):
     """
     raise NotImplementedError
 
-  @lru_cache(maxsize=100)
   def embed_entity(self, s: Sample) -> np.array:
     """
     Compute the embedding for the provided entity.
@@ -45,7 +43,6 @@ class BaseEmbedding(abc.ABC):
     """
     raise NotImplementedError
 
-  @lru_cache(maxsize=100)
   def embed_predicate(self, s: Sample) -> np.array:
     """
     Compute the embedding for the provided predicate.
@@ -60,7 +57,7 @@ class BaseEmbedding(abc.ABC):
 
 
 class KGE(BaseEmbedding):
-  def __init__(self, model_path: str):
+  def __init__(self, model_path: str, dtype: Optional[str] = None):
     """
     Initialise the Knowledge Graph Embeddings trained using graphvite [1].
 
@@ -68,15 +65,21 @@ class KGE(BaseEmbedding):
 
     Args:
         model_path (str): Path to the embedding model.
+        dtype (Optional[str], optional): Store the entity embeddings quantized,
+          either "float16" or "int8". See ~antonomasia.quantization.QuantizedMatrix.
+          Defaults to None, i.e. full precision.
     """
+    import pickle
+
     with open(model_path, "rb") as f:
       model = pickle.load(f)
     
     self.e2id = model.graph.entity2id
     self.p2id = model.graph.relation2id
     self.id2e = { v: k for k, v in self.e2id.items() }
-    self.ee = model.solver.entity_embeddings
+    self.ee = quantize(model.solver.entity_embeddings, dtype)
     self.pe = model.solver.relation_embeddings
+    self.name = f"kge:{os.path.abspath(model_path)}:{os.stat(model_path).st_mtime_ns}:{dtype}"
 
   def __contains__(self, s: Sample) -> bool:
     """
@@ -96,6 +99,7 @@ class KGE(BaseEmbedding):
     """
     return s.wikidata_iri in self.e2id
 
+  @cached("entity")
   def embed_entity(self, s: Sample) -> np.array:
     """
     Retrieve the embedding of an entity.
@@ -108,6 +112,7 @@ class KGE(BaseEmbedding):
     """
     return self.ee[self.e2id[s.wikidata_iri]]
 
+  @cached("predicate")
   def embed_predicate(self, s: str) -> np.array:
     """
     Retrieve the embedding of a predicate.
@@ -132,12 +137,16 @@ class WordEmbedding(BaseEmbedding):
     Args:
         method (str): Method to use for the word embeddings
     """
+    # gensim is only imported when word embeddings are used
+    import gensim.downloader
+
     if method == "word2vec":
       self.emb = gensim.downloader.load("word2vec-google-news-300")
     elif method == "glove":
       self.emb = gensim.downloader.load("glove-wiki-gigaword-300")
     else:
       raise ValueError(f"{method} is not a supported embedding method!")
+    self.name = f"we:{method}"
       
   def __contains__(self, s: Sample) -> bool:
     """
@@ -159,6 +168,7 @@ class WordEmbedding(BaseEmbedding):
     
     return contains
 
+  @cached("entity", by_label=True)
   def embed_entity(self, s: Sample) -> np.array:
     """
     Retrieve the embedding of a string s.
@@ -172,7 +182,10 @@ class WordEmbedding(BaseEmbedding):
     Returns:
         np.array: Embedding using numpy vector.
     """
-    label = s.label.lower()
+    return self._embed_label(s.label)
+
+  def _embed_label(self, label: str) -> np.array:
+    label = label.lower()
     if " " in label:
       label = label.split()
       embs = [self.emb[w] for w in label if w in self.emb]
@@ -187,10 +200,12 @@ class WordEmbedding(BaseEmbedding):
       emb = np.random.random(self.emb.vector_size)
     return emb
 
+  @cached("predicate")
   def embed_predicate(self, s: str) -> np.array:
     """
     A predicate is embedded equivalently to an entityt. 
-    See ~embed_entity.
+    See ~embed_entity. Its label is fetched from Wikidata once
+    and kept in the shared cache.
 
     Args:
         s (str): Wikidata ID of the predicate
@@ -198,9 +213,8 @@ class WordEmbedding(BaseEmbedding):
     Returns:
         np.array: Embedding using numpy vector.
     """
-    client = Client()
-    label = str(client.get(s, load=True).label)
-    return self.embed_entity(Sample(s, label, []))
+    label = get_cache().label(s, lambda: str(get_client().get(s, load=True).label))
+    return self._embed_label(label)
 
 
 class MetaEmbedding(BaseEmbedding):
@@ -218,6 +232,7 @@ class MetaEmbedding(BaseEmbedding):
 
     assert method in ["concatenate", "average"]
     self.method = method
+    self.name = f"meta:{method}:{word_embedding.name}:{kge.name}"
 
   def __contains__(self, s: Sample) -> bool:
     """
@@ -256,6 +271,7 @@ class MetaEmbedding(BaseEmbedding):
     
     return emb    
 
+  @cached("entity", by_label=True)
   def embed_entity(self, s: Sample) -> np.array:
     """
     Retrieve the embedding of a string s.
@@ -274,6 +290,7 @@ class MetaEmbedding(BaseEmbedding):
     emb = self._combine_embeddings(kge_emb, we_emb)
     return emb
 
+  @cached("predicate")
   def embed_predicate(self, s: str) -> np.array:
     """
     A predicate is embedded equivalently to an entityt. 
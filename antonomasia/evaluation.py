@@ -0,0 +1,122 @@
+from typing import Callable, Dict, List, Optional, Tuple
+import time
+import tracemalloc
+import numpy as np
+
+from antonomasia.utils import Sample
+
+Backend = Callable[[Sample, str, int], Optional[List[Tuple[Sample, float]]]]
+
+
+def recall_at_k(exact: List[str], approx: List[str]) -> float:
+  """
+  Fraction of the exact top-k retrieved by an approximate search.
+
+  Args:
+      exact (List[str]): Wikidata IRIs returned by the exact search.
+      approx (List[str]): Wikidata IRIs returned by the approximate search.
+
+  Returns:
+      float: The recall, 1 if the exact search returned nothing.
+  """
+  if not exact:
+    return 1.0
+  return len(set(exact).intersection(approx)) / len(exact)
+
+
+def rank_correlation(exact: List[str], approx: List[str]) -> float:
+  """
+  Spearman correlation between the ranks given by the two searches to the
+  results they have in common.
+
+  Args:
+      exact (List[str]): Wikidata IRIs returned by the exact search.
+      approx (List[str]): Wikidata IRIs returned by the approximate search.
+
+  Returns:
+      float: The correlation, NaN if less than two results are shared.
+  """
+  approx_rank = { iri: i for i, iri in enumerate(approx) }
+  common = [iri for iri in exact if iri in approx_rank]
+  n = len(common)
+  if n < 2:
+    return np.nan
+  # re-rank within the common results, so that both rankings are permutations of 0..n-1
+  order = np.argsort([approx_rank[iri] for iri in common])
+  d = np.empty(n)
+  d[order] = np.arange(n)
+  d -= np.arange(n)
+  return float(1 - 6 * np.sum(d ** 2) / (n * (n ** 2 - 1)))
+
+
+def _run(backend: Backend, a_samples: List[Sample], context: str, k: int) -> Tuple[List, np.array]:
+  results, latency = [], []
+  for a in a_samples:
+    start = time.perf_counter()
+    found = backend(a, context, k)
+    latency.append(time.perf_counter() - start)
+    results.append(None if found is None else [b.wikidata_iri for b, _ in found])
+  return results, np.array(latency)
+
+
+def _peak_memory(backend: Backend, a_samples: List[Sample], context: str, k: int) -> int:
+  peak = 0
+  for a in a_samples:
+    tracemalloc.start()
+    try:
+      backend(a, context, k)
+      peak = max(peak, tracemalloc.get_traced_memory()[1])
+    finally:
+      tracemalloc.stop()
+  return peak
+
+
+def evaluate_backends(exact: Backend, backends: Dict[str, Backend], a_samples: List[Sample],
+                      context: str = "P106",
+                      k: int = 10,
+                      nbytes: Optional[Dict[str, int]] = None,
+                      memory_samples: int = 10) -> Dict[str, Dict[str, float]]:
+  """
+  Compare search backends with the exact search of ~AntonomasiaGenerator.top_k.
+  A backend is a function taking A, the context and k, and returning the top-k Bs
+  with their score, or None if it cannot answer, e.g. an A missing from a neighbour table.
+
+  Latencies are measured on a first pass over all the As. The peak memory allocated
+  by a query is measured on a second pass over the first memory_samples As, since
+  tracing allocations slows the queries down. Allocations made by worker processes,
+  as in ~antonomasia.search.ShardedSearch, are not traced.
+
+  Args:
+      exact (Backend): Exact search, e.g. ~AntonomasiaGenerator.generate.
+      backends (Dict[str, Backend]): Backends to evaluate, indexed by their name.
+      a_samples (List[Sample]): A entities used as queries.
+      context (str, optional): Predicate for c. Defaults to "P106".
+      k (int, optional): Number of top results. Defaults to 10.
+      nbytes (Optional[Dict[str, int]], optional): Memory held by each backend, e.g. its index,
+        including "exact". Defaults to None.
+      memory_samples (int, optional): Number of As used to measure the peak memory. Defaults to 10.
+
+  Returns:
+      Dict[str, Dict[str, float]]: For "exact" and every backend, the mean recall@k and rank
+        correlation over the answered As, the fraction of answered As, the p50 and p99
+        latency in seconds, the memory held and the peak memory allocated by a query in bytes.
+  """
+  nbytes = nbytes or {}
+  baseline, _ = _run(exact, a_samples, context, k)
+
+  report = {}
+  for name, backend in [("exact", exact)] + list(backends.items()):
+    results, latency = _run(backend, a_samples, context, k)
+    answered = [(e, r) for e, r in zip(baseline, results) if r is not None and e is not None]
+    correlation = [rank_correlation(e, r) for e, r in answered]
+    correlation = [c for c in correlation if not np.isnan(c)]
+    report[name] = {
+      "recall": float(np.mean([recall_at_k(e, r) for e, r in answered])) if answered else np.nan,
+      "rank_correlation": float(np.mean(correlation)) if correlation else np.nan,
+      "coverage": len(answered) / max(len(a_samples), 1),
+      "p50": float(np.percentile(latency, 50)),
+      "p99": float(np.percentile(latency, 99)),
+      "nbytes": nbytes.get(name, 0),
+      "peak_bytes": _peak_memory(backend, a_samples[:memory_samples], context, k),
+    }
+  return report
@@ -1,14 +1,20 @@
-from typing import List, Tuple, Callable
+from typing import Dict, List, Optional, Tuple, Callable
+from collections import namedtuple
+import threading
 import numpy as np
-import pickle
-from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances
 
 from antonomasia.embeddings import BaseEmbedding
-from antonomasia.utils import Sample
+from antonomasia.utils import Sample, POOL_CLASSES
+
+# Immutable view over the pool of B. Rows of b_emb are aligned with b_pool,
+# removed entries are kept as tombstones (alive set to False) until compaction.
+PoolSnapshot = namedtuple("PoolSnapshot", ["b_pool", "b_emb", "alive"])
 
 class AntonomasiaGenerator(object):
 
-  def __init__(self, emb: BaseEmbedding, b_pool: List[Tuple[str, List[str]]]):
+  def __init__(self, emb: BaseEmbedding, b_pool: List[Tuple[str, List[str]]], compaction_ratio: float = 0.25,
+               resolve: Optional[Callable[[List[str], str], Dict[str, Sample]]] = None,
+               resolve_batch: int = 200):
     """
     Initialise the generator using an embedding method and a pool of candidates.
 
@@ -17,9 +23,240 @@ class AntonomasiaGenerator(object):
         b_pool (List[Tuple[str, List[str]]]): List B candidates to draw from in the form of tuples.
           The format is (Wikidata IRI, classifying features) where the classifying features 
           are a list of strings that classify an entity, e.g. its profession.
+        compaction_ratio (float, optional): Fraction of removed entries that triggers
+          a background compaction of the pool. Defaults to 0.25.
+        resolve (Optional[Callable[[List[str], str], Dict[str, Sample]]], optional): Retrieve the samples
+          of several entities for a context, e.g. ~antonomasia.utils.get_samples, see ~b_classes.
+          Defaults to None, i.e. the classifying features of the pool are used for every context.
+        resolve_batch (int, optional): Number of entities resolved at once. Defaults to 200.
     """
     self.emb = emb
-    self.b_pool = [b for b in b_pool if b in self.emb]
+    self.compaction_ratio = compaction_ratio
+    self.resolve = resolve
+    self.resolve_batch = resolve_batch
+    self._classes = {}
+    self._classes_lock = threading.Lock()
+    self._lock = threading.RLock()
+    self._compacting = False
+    self._buffer = None
+    pool = tuple(b for b in b_pool if b in self.emb)
+    self._snapshot = PoolSnapshot(pool, None, np.ones(len(pool), dtype=bool))
+
+  @property
+  def b_pool(self) -> List[Sample]:
+    """
+    List of the B candidates currently available.
+    """
+    snap = self._snapshot
+    return [b for b, alive in zip(snap.b_pool, snap.alive) if alive]
+
+  def snapshot(self) -> PoolSnapshot:
+    """
+    Retrieve a consistent view of the pool of B together with its embeddings.
+    The view is never modified by further updates, hence it can be used while
+    the pool is being changed.
+
+    Returns:
+        PoolSnapshot: Current state of the pool.
+    """
+    snap = self._snapshot
+    if snap.b_emb is None:
+      with self._lock:
+        snap = self._snapshot
+        if snap.b_emb is None:
+          self._buffer = np.stack([self.emb.embed_entity(x) for x in snap.b_pool])
+          snap = PoolSnapshot(snap.b_pool, self._buffer, snap.alive)
+          self._snapshot = snap
+    return snap
+
+  def pool_embeddings(self) -> np.array:
+    """
+    Embed the whole pool of B candidates.
+    The matrix is computed only once and then reused by every further call.
+
+    Returns:
+        np.array: Matrix with one row per entry of b_pool.
+    """
+    snap = self.snapshot()
+    return snap.b_emb if snap.alive.all() else snap.b_emb[snap.alive]
+
+  def b_classes(self, context: str, b_pool: Optional[List[Sample]] = None) -> List[set]:
+    """
+    Classifying features of the candidates along a context.
+    The classes of the pool are the professions (see ~antonomasia.utils.POOL_CLASSES),
+    the ones along other contexts are retrieved with resolve on first use and kept.
+    Without resolve, the classes of the pool are used for every context.
+
+    Args:
+        context (str): Predicate used as context, e.g. "P101".
+        b_pool (Optional[List[Sample]], optional): Candidates. Defaults to b_pool.
+
+    Returns:
+        List[set]: The classifying features of every entry of b_pool.
+    """
+    b_pool = self.b_pool if b_pool is None else b_pool
+    if context == POOL_CLASSES or self.resolve is None:
+      return [b.classes for b in b_pool]
+
+    with self._classes_lock:
+      known = self._classes.setdefault(context, {})
+      missing = [b.wikidata_iri for b in b_pool if b.wikidata_iri not in known]
+      for i in range(0, len(missing), self.resolve_batch):
+        batch = missing[i:i + self.resolve_batch]
+        found = self.resolve(batch, context)
+        for iri in batch:
+          # entities without a value along the context exclude nothing
+          known[iri] = set(found[iri].classes) if iri in found else set()
+      return [known[b.wikidata_iri] for b in b_pool]
+
+  def class_mask(self, classes: List[str], b_pool: Optional[List[Sample]] = None,
+                 context: str = POOL_CLASSES) -> np.array:
+    """
+    Compute which entries of b_pool share at least one classifying feature
+    with the provided classes.
+
+    Args:
+        classes (List[str]): Classifying features, e.g. the professions of A.
+        b_pool (Optional[List[Sample]], optional): Candidates to check. Defaults to b_pool.
+        context (str, optional): Context of the classifying features, see ~b_classes. Defaults to POOL_CLASSES.
+
+    Returns:
+        np.array: Boolean mask over b_pool, True where b has to be excluded.
+    """
+    classes = set(classes)
+    b_pool = self.b_pool if b_pool is None else b_pool
+    return np.array([len(classes.intersection(b)) > 0 for b in self.b_classes(context, b_pool)], dtype=bool)
+
+  def exclusion_masks(self, a: Sample, contexts: List[str],
+                      a_classes: Optional[Dict[str, List[str]]] = None,
+                      b_pool: Optional[List[Sample]] = None) -> np.array:
+    """
+    Compute ~class_mask for several contexts.
+
+    Args:
+        a (Sample): Entity a sample
+        contexts (List[str]): Predicates for c.
+        a_classes (Optional[Dict[str, List[str]]], optional): Classifying features of a
+          for each context. Defaults to a.classes for every context.
+        b_pool (Optional[List[Sample]], optional): Candidates to check. Defaults to b_pool.
+
+    Returns:
+        np.array: Boolean matrix (len(contexts), len(b_pool)), True where b has to be excluded.
+    """
+    a_classes = a_classes or {}
+    b_pool = self.b_pool if b_pool is None else b_pool
+    masks = []
+    for c in contexts:
+      masks.append(self.class_mask(a_classes.get(c, a.classes), b_pool, c))
+    return np.stack(masks)
+
+  def add_b(self, samples: List[Sample]) -> int:
+    """
+    Add new candidates to the pool of B.
+    Their embeddings are appended to the cached matrix, so that the existing
+    entries do not need to be embedded again.
+    Samples that are already in the pool or not covered by the embedding are ignored.
+
+    Args:
+        samples (List[Sample]): Candidates to add.
+
+    Returns:
+        int: Number of added candidates.
+    """
+    with self._lock:
+      snap = self.snapshot()
+      present = set(b.wikidata_iri for b in self.b_pool)
+      new = []
+      for s in samples:
+        if s.wikidata_iri not in present and s in self.emb:
+          present.add(s.wikidata_iri)
+          new.append(s)
+      if new:
+        self._snapshot = self._append(snap, new, snap.alive)
+      return len(new)
+
+  def remove_b(self, wikidata_iris: List[str]) -> int:
+    """
+    Remove candidates from the pool of B.
+    The rows are only marked as removed, they are dropped from the cached
+    matrix by a background compaction.
+
+    Args:
+        wikidata_iris (List[str]): Wikidata IRIs of the candidates to remove.
+
+    Returns:
+        int: Number of removed candidates.
+    """
+    with self._lock:
+      snap = self.snapshot()
+      alive = self._tombstone(snap, set(wikidata_iris))
+      removed = int(snap.alive.sum() - alive.sum())
+      if removed:
+        self._snapshot = PoolSnapshot(snap.b_pool, snap.b_emb, alive)
+        self._schedule_compaction()
+      return removed
+
+  def update_b(self, samples: List[Sample]) -> int:
+    """
+    Replace candidates of the pool of B, e.g. when their classifying features changed.
+    Samples whose IRI is not yet in the pool are added.
+
+    Args:
+        samples (List[Sample]): New version of the candidates.
+
+    Returns:
+        int: Number of provided candidates that are in the pool after the update.
+    """
+    with self._classes_lock:
+      for known in self._classes.values():
+        for s in samples:
+          known.pop(s.wikidata_iri, None)
+    with self._lock:
+      snap = self.snapshot()
+      alive = self._tombstone(snap, set(s.wikidata_iri for s in samples))
+      new = list({ s.wikidata_iri: s for s in samples if s in self.emb }.values())
+      self._snapshot = self._append(snap, new, alive)
+      self._schedule_compaction()
+      return len(new)
+
+  def compact(self):
+    """
+    Drop the removed candidates from the cached matrix.
+    Snapshots taken before the compaction remain valid.
+    """
+    with self._lock:
+      snap = self.snapshot()
+      self._compacting = False
+      if snap.alive.all():
+        return
+      self._buffer = snap.b_emb[snap.alive]
+      pool = tuple(b for b, alive in zip(snap.b_pool, snap.alive) if alive)
+      self._snapshot = PoolSnapshot(pool, self._buffer, np.ones(len(pool), dtype=bool))
+
+  def _tombstone(self, snap: PoolSnapshot, wikidata_iris: set) -> np.array:
+    removed = np.array([b.wikidata_iri in wikidata_iris for b in snap.b_pool], dtype=bool)
+    return snap.alive & ~removed
+
+  def _append(self, snap: PoolSnapshot, new: List[Sample], alive: np.array) -> PoolSnapshot:
+    if not new:
+      return PoolSnapshot(snap.b_pool, snap.b_emb, alive)
+    n, m = len(snap.b_pool), len(new)
+    embs = np.stack([self.emb.embed_entity(s) for s in new])
+    if n + m > len(self._buffer):
+      # rows past n are not visible to any snapshot, hence they can be written
+      # in place; otherwise grow the buffer geometrically
+      buffer = np.empty((max(2 * len(self._buffer), n + m), self._buffer.shape[1]), dtype=self._buffer.dtype)
+      buffer[:n] = self._buffer[:n]
+      self._buffer = buffer
+    self._buffer[n:n + m] = embs
+    return PoolSnapshot(snap.b_pool + tuple(new), self._buffer[:n + m], np.concatenate([alive, np.ones(m, dtype=bool)]))
+
+  def _schedule_compaction(self):
+    snap = self._snapshot
+    removed = len(snap.alive) - snap.alive.sum()
+    if not self._compacting and removed > self.compaction_ratio * len(snap.alive):
+      self._compacting = True
+      threading.Thread(target=self.compact, daemon=True).start()
 
   def top_k(self, a: np.array, b: np.array, 
             k: int = 10, 
@@ -45,6 +282,8 @@ class AntonomasiaGenerator(object):
         Tuple[np.array, np.array]: A tuple containing the index of the top-k 
           results together with their similarity score.
     """
+    from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances
+
     if similarity_fn == "cosine":
       similarity_fn = cosine_similarity
       reverse = True
@@ -79,23 +318,49 @@ class AntonomasiaGenerator(object):
     """
     a_emb = self.emb.embed_entity(a)
 
-    # exclude entities with the same profession
-    filtered_b_pool = [
-      b for b in self.b_pool
-      if len(set(a.classes).intersection(b.classes)) == 0
-    ]
+    # exclude entities with the same classes along c
+    snap = self.snapshot()
+    keep = snap.alive & ~self.class_mask(a.classes, snap.b_pool, c)
+    filtered_b_pool = [b for b, k in zip(snap.b_pool, keep) if k]
 
-    b_emb = np.stack([self.emb.embed_entity(x) for x in filtered_b_pool])
+    b_emb = snap.b_emb[keep]
     c_emb = self.emb.embed_predicate(c)
 
     return a_emb, b_emb, filtered_b_pool, c_emb
 
-  def project_embeddings(self, a: np.array, b: np.array, c: np.array) -> Tuple[np.array, np.array]:
+  def generate(self, a: Sample, c: str,
+               projection: str = "translate",
+               k: int = 10,
+               magnitude_sort: bool = False,
+               similarity_fn: str = "cosine") -> List[Tuple[Sample, float]]:
+    """
+    Retrieve the top-k B of a for the context c.
+    Shorthand for ~embed_a_b_c, ~transform_embeddings and ~top_k.
+
+    Args:
+        a (Sample): Entity a sample
+        c (str): Predicate for c
+        projection (str, optional): Either "translate" or "project". Defaults to "translate".
+        k (int, optional): Number of top results. Defaults to 10.
+        magnitude_sort (bool, optional): See ~top_k. Defaults to False.
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+    Returns:
+        List[Tuple[Sample, float]]: The Bs together with their score.
+    """
+    a_emb, b_emb, b_ids, c_emb = self.embed_a_b_c(a, c)
+    a_t, b_t = self.transform_embeddings(a_emb, b_emb, c_emb, projection)
+    top_k, sim = self.top_k(a_t, b_t, k=k, magnitude_sort=magnitude_sort, similarity_fn=similarity_fn)
+    return [(b_ids[idx], sim[idx]) for idx in top_k]
+
+  @staticmethod
+  def project_embeddings(a: np.array, b: np.array, c: np.array) -> Tuple[np.array, np.array]:
     """
     Compute the embeddings for a and c by projecting a and al the b to a 
     plane that is orthogonal to c. 
     The similarity between a and b is hence going to be computed in such a way
     that the characteristic c is ignored.
+    a can also be a matrix, in which case every row is projected.
 
     Args:
         a (np.array): Embedding for a
@@ -105,11 +370,12 @@ class AntonomasiaGenerator(object):
     Returns:
         Tuple[np.array, np.array]: The embedding of a and b in the projected space
     """
-    a_proj = a - (c * (np.dot(a, c) / np.dot(c, c)))
+    a_proj = a - (c * np.expand_dims(np.dot(a, c) / np.dot(c, c), -1))
     b_proj = b - (c * (np.dot(b, c) / np.dot(c, c)).reshape(-1, 1))
     return a_proj, b_proj
 
-  def translate_embeddings(self, a: np.array, b: np.array, c: np.array) -> Tuple[np.array, np.array]:
+  @staticmethod
+  def translate_embeddings(a: np.array, b: np.array, c: np.array) -> Tuple[np.array, np.array]:
     """
     Compute the embeddings for a and c by removing c from both and and b to ignore
     the influence of c in the similarity computation.
@@ -126,3 +392,199 @@ class AntonomasiaGenerator(object):
     b_proj = b - c.reshape((1, -1))
     return a_proj, b_proj
 
+
+
+  @staticmethod
+  def transform_embeddings(a: np.array, b: np.array, c: np.array, 
+                           projection: str = "translate") -> Tuple[np.array, np.array]:
+    """
+    Apply the requested projection method to a and b.
+    See ~translate_embeddings and ~project_embeddings.
+
+    Args:
+      a (np.array): Embedding for a
+      b (np.array): Embedding for b
+      c (np.array): Embedding for c
+      projection (str, optional): Either "translate" or "project". Defaults to "translate".
+
+    Returns:
+        Tuple[np.array, np.array]: The embedding of a and b in the projected space
+    """
+    if projection == "translate":
+      return AntonomasiaGenerator.translate_embeddings(a, b, c)
+    elif projection == "project":
+      return AntonomasiaGenerator.project_embeddings(a, b, c)
+    raise ValueError(f"projection method {projection} is not supported!")
+
+  @staticmethod
+  def top_k_batch(a: np.array, b: np.array, exclude: np.array,
+                  k: int = 10,
+                  similarity_fn: str = "cosine") -> Tuple[np.array, np.array]:
+    """
+    Batched version of ~top_k: rank b for several a at once.
+    Excluded pairs are never returned. The ranking mirrors ~top_k on the
+    filtered pool, hence the best candidate of every row is skipped as well.
+    Rows with fewer than k admissible candidates are padded with -1.
+
+    Args:
+        a (np.array): Matrix with one A per row.
+        b (np.array): Set of vectors representing the possible Bs.
+        exclude (np.array): Boolean matrix (len(a), len(b)), True for the pairs to ignore.
+        k (int, optional): Number of top results. Defaults to 10.
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+    Returns:
+        Tuple[np.array, np.array]: Indices over b and scores of the top-k results, 
+          both with shape (len(a), k).
+    """
+    from sklearn.metrics.pairwise import cosine_similarity, euclidean_distances
+
+    if similarity_fn == "cosine":
+      sim = cosine_similarity(a, b)
+    elif similarity_fn == "euclidean":
+      sim = euclidean_distances(a, b)
+    else:
+      raise ValueError(f"similarity function {similarity_fn} is not supported!")
+    return AntonomasiaGenerator.rank_batch(sim, exclude, k=k, similarity_fn=similarity_fn)
+
+  @staticmethod
+  def rank_batch(sim: np.array, exclude: np.array,
+                 k: int = 10,
+                 similarity_fn: str = "cosine",
+                 skip_first: bool = True) -> Tuple[np.array, np.array]:
+    """
+    Rank the rows of an already computed similarity matrix, see ~top_k_batch.
+
+    Args:
+        sim (np.array): Similarity (cosine) or distance (euclidean) matrix.
+        exclude (np.array): Boolean matrix with the same shape of sim, True for the pairs to ignore.
+        k (int, optional): Number of top results. Defaults to 10.
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+        skip_first (bool, optional): Skip the best candidate as ~top_k does. Defaults to True.
+
+    Returns:
+        Tuple[np.array, np.array]: Indices and scores of the top-k results, 
+          both with shape (len(sim), k).
+    """
+    if similarity_fn == "cosine":
+      worst = -np.inf
+      order = -sim
+    elif similarity_fn == "euclidean":
+      worst = np.inf
+      order = sim.copy()
+    else:
+      raise ValueError(f"similarity function {similarity_fn} is not supported!")
+
+    order[exclude] = np.inf
+    skip = 1 if skip_first else 0
+    n = min(k + skip, order.shape[1])
+    top_k = np.argpartition(order, n - 1, axis=1)[:, :n]
+    top_k = np.take_along_axis(top_k, np.argsort(np.take_along_axis(order, top_k, axis=1), axis=1), axis=1)
+    top_k = top_k[:, skip:]
+
+    scores = np.take_along_axis(sim, top_k, axis=1)
+    invalid = np.take_along_axis(exclude, top_k, axis=1)
+    top_k[invalid] = -1
+    scores[invalid] = worst
+
+    missing = k - top_k.shape[1]
+    if missing > 0:
+      top_k = np.pad(top_k, [(0, 0), (0, missing)], constant_values=-1)
+      scores = np.pad(scores, [(0, 0), (0, missing)], constant_values=worst)
+    return top_k, scores
+
+  @staticmethod
+  def context_similarity(a: np.array, b: np.array, c: np.array,
+                         projection: str = "translate",
+                         similarity_fn: str = "cosine",
+                         b_norms: Optional[np.array] = None) -> np.array:
+    """
+    Score a against every b under several contexts at once.
+    The result equals applying ~transform_embeddings and the similarity function
+    of ~top_k for every row of c, but the transformed vectors are never built:
+    the scores are derived from the dot products of b with a and with every c,
+    so the pool is read a single time whatever the number of contexts.
+
+    Args:
+        a (np.array): Embedding for a
+        b (np.array): Set of vectors representing the possible Bs.
+        c (np.array): Matrix with the embedding of one context per row.
+        projection (str, optional): Either "translate" or "project". Defaults to "translate".
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+        b_norms (Optional[np.array], optional): Squared norms of the rows of b, computed if not provided.
+
+    Returns:
+        np.array: Scores with shape (len(c), len(b)).
+    """
+    if projection == "project":
+      c = c / np.linalg.norm(c, axis=1, keepdims=True)
+    elif projection != "translate":
+      raise ValueError(f"projection method {projection} is not supported!")
+
+    prod = b @ np.vstack([a, c]).T
+    ab, bc = prod[:, 0], prod[:, 1:].T
+    ac = c @ a
+    aa = np.dot(a, a)
+    bb = np.einsum("ij,ij->i", b, b) if b_norms is None else b_norms
+
+    if projection == "translate":
+      cc = np.einsum("ij,ij->i", c, c)[:, None]
+      dot = ab[None, :] - ac[:, None] - bc + cc
+      a_norm = aa - 2 * ac[:, None] + cc
+      b_norm = bb[None, :] - 2 * bc + cc
+    else:
+      dot = ab[None, :] - ac[:, None] * bc
+      a_norm = (aa - ac ** 2)[:, None]
+      b_norm = bb[None, :] - bc ** 2
+    a_norm = np.maximum(a_norm, 0)
+    b_norm = np.maximum(b_norm, 0)
+
+    if similarity_fn == "cosine":
+      norm = np.sqrt(a_norm) * np.sqrt(b_norm)
+      return dot / np.where(norm == 0, 1, norm)
+    elif similarity_fn == "euclidean":
+      return np.sqrt(np.maximum(a_norm + b_norm - 2 * dot, 0))
+    raise ValueError(f"similarity function {similarity_fn} is not supported!")
+
+  def top_k_contexts(self, a: Sample, contexts: List[str],
+                     a_classes: Optional[Dict[str, List[str]]] = None,
+                     projection: str = "translate",
+                     k: int = 10,
+                     magnitude_sort: bool = False,
+                     similarity_fn: str = "cosine") -> Dict[str, List[Tuple[Sample, float]]]:
+    """
+    Retrieve the top-k B of a along several contexts in a single pass over the pool,
+    see ~context_similarity.
+    For every context, the Bs sharing a classifying feature with a are excluded.
+
+    Args:
+        a (Sample): Entity a sample
+        contexts (List[str]): Predicates for c, e.g. ["P106", "P101", "P136"].
+        a_classes (Optional[Dict[str, List[str]]], optional): Classifying features of a
+          for each context. Defaults to a.classes for every context.
+        projection (str, optional): Either "translate" or "project". Defaults to "translate".
+        k (int, optional): Number of top results per context. Defaults to 10.
+        magnitude_sort (bool, optional): See ~top_k. Defaults to False.
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+    Returns:
+        Dict[str, List[Tuple[Sample, float]]]: The Bs together with their score for each context.
+    """
+    snap = self.snapshot()
+    a_emb = self.emb.embed_entity(a)
+    c_emb = np.stack([self.emb.embed_predicate(c) for c in contexts])
+
+    sim = self.context_similarity(a_emb, snap.b_emb, c_emb, projection, similarity_fn)
+    exclude = self.exclusion_masks(a, contexts, a_classes, snap.b_pool) | ~snap.alive[None, :]
+    top_k, scores = self.rank_batch(sim, exclude, k=k, similarity_fn=similarity_fn)
+
+    results = {}
+    for i, c in enumerate(contexts):
+      valid = top_k[i] >= 0
+      idx, score = top_k[i][valid], scores[i][valid]
+      if magnitude_sort:
+        _, b = self.transform_embeddings(a_emb, snap.b_emb[idx], c_emb[i], projection)
+        order = np.argsort(np.abs(b).sum(axis=1))[::-1]
+        idx, score = idx[order], score[order]
+      results[c] = [(snap.b_pool[j], float(s)) for j, s in zip(idx, score)]
+    return results
@@ -0,0 +1,53 @@
+from typing import Dict, List, Optional
+
+from antonomasia.embeddings import BaseEmbedding, KGE, WordEmbedding, MetaEmbedding
+
+# Embedding methods offered by the webapp and the offline tools
+METHODS = ["kge", "word2vec", "glove", "meta_w2v_conc", "meta_w2v_average", "meta_glove_conc", "meta_glove_average"]
+
+
+def load_models(kge_path: str, methods: List[str] = METHODS, kge_dtype: Optional[str] = None) -> Dict[str, BaseEmbedding]:
+  """
+  Load the requested embedding methods, sharing the underlying models
+  between the meta-embeddings.
+
+  Args:
+      kge_path (str): Path to the KGE weigths.
+      methods (List[str], optional): Names of the methods to load, see METHODS. Defaults to METHODS.
+      kge_dtype (Optional[str], optional): Quantization of the KGE entity embeddings. Defaults to None.
+
+  Returns:
+      Dict[str, BaseEmbedding]: The embedding methods indexed by their name.
+  """
+  kge = KGE(kge_path, dtype=kge_dtype) if any(m == "kge" or m.startswith("meta") for m in methods) else None
+  word2vec = WordEmbedding("word2vec") if any(m == "word2vec" or "w2v" in m for m in methods) else None
+  glove = WordEmbedding("glove") if any("glove" in m for m in methods) else None
+  models = {
+    "kge": lambda: kge,
+    "word2vec": lambda: word2vec,
+    "glove": lambda: glove,
+    "meta_w2v_conc": lambda: MetaEmbedding(word2vec, kge, method="concatenate"),
+    "meta_w2v_average": lambda: MetaEmbedding(word2vec, kge, method="average"),
+    "meta_glove_conc": lambda: MetaEmbedding(glove, kge, method="concatenate"),
+    "meta_glove_average": lambda: MetaEmbedding(glove, kge, method="average"),
+  }
+  return { m: models[m]() for m in methods }
+
+
+def model_nbytes(emb: BaseEmbedding) -> int:
+  """
+  Size of the arrays held by an embedding method, quantized ones included.
+
+  Args:
+      emb (BaseEmbedding): The embedding method.
+
+  Returns:
+      int: Size in bytes, 0 for unknown methods.
+  """
+  if isinstance(emb, KGE):
+    return emb.ee.nbytes + emb.pe.nbytes
+  elif isinstance(emb, WordEmbedding):
+    return emb.emb.vectors.nbytes
+  elif isinstance(emb, MetaEmbedding):
+    return model_nbytes(emb.kge) + model_nbytes(emb.we)
+  return 0
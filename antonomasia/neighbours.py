@@ -0,0 +1,333 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from multiprocessing import Pool
+import numpy as np
+
+from antonomasia.embeddings import BaseEmbedding
+from antonomasia.generation import AntonomasiaGenerator
+from antonomasia.utils import Sample
+
+PROJECTIONS = ["translate", "project"]
+DISTANCES = ["cosine", "euclidean"]
+
+_worker = {}
+
+
+def config_key(method: str, projection: str, distance: str) -> str:
+  """
+  Name of a configuration inside a neighbour table.
+
+  Args:
+      method (str): Embedding method, e.g. "kge", "glove" or "meta_w2v_conc".
+      projection (str): Projection method, "translate" or "project".
+      distance (str): Distance function, "cosine" or "euclidean".
+
+  Returns:
+      str: Configuration name.
+  """
+  return f"{method}_{projection}_{distance}"
+
+
+def class_incidence(pool: List[Sample]) -> np.array:
+  """
+  Build a (samples x classes) incidence matrix, so that two samples share
+  a classifying feature iff the dot product of their rows is positive.
+
+  Args:
+      pool (List[Sample]): Samples to encode.
+
+  Returns:
+      np.array: Incidence matrix.
+  """
+  vocab = {}
+  for s in pool:
+    for c in s.classes:
+      vocab.setdefault(c, len(vocab))
+
+  incidence = np.zeros((len(pool), max(len(vocab), 1)), dtype=np.float32)
+  for i, s in enumerate(pool):
+    incidence[i, [vocab[c] for c in s.classes]] = 1
+  return incidence
+
+
+def _init_worker(emb: np.array, incidence: np.array, k: int):
+  _worker["emb"] = emb
+  _worker["incidence"] = incidence
+  _worker["k"] = k
+
+
+def _score_chunk(task: Tuple[np.array, str]) -> Tuple[np.array, np.array]:
+  rows, distance = task
+  emb, incidence = _worker["emb"], _worker["incidence"]
+  exclude = (incidence[rows] @ incidence.T) > 0
+  return AntonomasiaGenerator.top_k_batch(emb[rows], emb, exclude, k=_worker["k"], similarity_fn=distance)
+
+
+def build_neighbour_table(models: Dict[str, BaseEmbedding], pool_of_b: List[Sample], path: str,
+                          k: int = 10,
+                          context: str = "P106",
+                          processes: Optional[int] = None,
+                          chunk_size: int = 256):
+  """
+  Compute the top-k B for every entity of the pool, used as A, under every
+  combination of embedding method, projection method and distance function.
+  The result is stored as a numpy archive that can be read by ~NeighbourTable.
+
+  Args:
+      models (Dict[str, BaseEmbedding]): Embedding methods indexed by their name.
+      pool_of_b (List[Sample]): Pool of B candidates, which is also the set of As.
+      path (str): Output path of the table.
+      k (int, optional): Number of neighbours to store per A. Defaults to 10.
+      context (str, optional): Predicate used as context C. Defaults to "P106".
+      processes (Optional[int], optional): Number of worker processes. Defaults to all cores.
+      chunk_size (int, optional): Number of As scored at once by a worker. Defaults to 256.
+  """
+  iris = np.array([s.wikidata_iri for s in pool_of_b])
+  position = { s.wikidata_iri: i for i, s in enumerate(pool_of_b) }
+  tables = {}
+
+  for method, emb in models.items():
+    generator = AntonomasiaGenerator(emb, pool_of_b)
+    rows = np.array([position[b.wikidata_iri] for b in generator.b_pool], dtype=np.int64)
+    pool = generator.pool_embeddings()
+    c = emb.embed_predicate(context)
+    incidence = class_incidence(generator.b_pool)
+    chunks = [np.arange(i, min(i + chunk_size, len(rows))) for i in range(0, len(rows), chunk_size)]
+
+    for projection in PROJECTIONS:
+      _, b = generator.transform_embeddings(pool, pool, c, projection)
+      magnitude = np.full(len(iris), np.nan, dtype=np.float32)
+      magnitude[rows] = np.abs(b).sum(axis=1)
+
+      with Pool(processes, initializer=_init_worker, initargs=(b, incidence, k)) as workers:
+        for distance in DISTANCES:
+          name = config_key(method, projection, distance)
+          results = workers.map(_score_chunk, [(chunk, distance) for chunk in chunks])
+
+          idx = np.full((len(iris), k), -1, dtype=np.int32)
+          score = np.full((len(iris), k), np.nan, dtype=np.float32)
+          local_idx = np.concatenate([r[0] for r in results])
+          idx[rows] = np.where(local_idx >= 0, rows[local_idx], -1)
+          score[rows] = np.concatenate([r[1] for r in results])
+
+          tables[f"{name}_idx"] = idx
+          tables[f"{name}_score"] = score
+          tables[f"{name}_magnitude"] = magnitude
+
+  configs = np.array(sorted(n[:-len("_idx")] for n in tables if n.endswith("_idx")))
+  # classes used by the exclusion masks, to detect the candidates updated after the build
+  classes = np.array(["_".join(sorted(s.classes)) for s in pool_of_b])
+  np.savez_compressed(path, iris=iris, classes=classes, k=np.array(k), context=np.array(context), configs=configs,
+                      **tables)
+
+
+def _stored_classes(data, iris: np.array) -> Optional[Dict[str, str]]:
+  if "classes" not in data:
+    return None
+  return { str(iri): str(c) for iri, c in zip(iris, data["classes"]) }
+
+
+def _changed(pool: Dict[str, Sample], classes: Optional[Dict[str, str]]) -> bool:
+  # tables built before the classes were stored cannot be checked
+  if classes is None:
+    return True
+  return any(iri not in classes or "_".join(sorted(b.classes)) != classes[iri] for iri, b in pool.items())
+
+
+class NeighbourTable(object):
+
+  def __init__(self, path: str, pool_of_b: List[Sample]):
+    """
+    Serve the neighbours precomputed by ~build_neighbour_table.
+
+    Args:
+        path (str): Path to the table.
+        pool_of_b (List[Sample]): Pool of B candidates used to resolve the stored IRIs.
+    """
+    self.data = np.load(path)
+    self.k = int(self.data["k"])
+    self.context = str(self.data["context"])
+    self.configs = set(str(c) for c in self.data["configs"])
+    self.iris = self.data["iris"]
+    self.rows = { str(iri): i for i, iri in enumerate(self.iris) }
+    self.classes = _stored_classes(self.data, self.iris)
+    self._cache = {}
+    self.stale = False
+    self.refresh(pool_of_b)
+
+  def refresh(self, pool_of_b: List[Sample]):
+    """
+    Follow an update of the pool of B.
+    Results containing removed candidates are not served anymore, while new
+    candidates, as well as candidates whose classes changed (see
+    ~AntonomasiaGenerator.update_b), make the whole table stale until it is rebuilt,
+    since they could enter or leave the top-k of any A.
+
+    Args:
+        pool_of_b (List[Sample]): Current pool of B candidates.
+    """
+    pool = { b.wikidata_iri: b for b in pool_of_b }
+    stale = _changed(pool, self.classes)
+    # never expose the new pool as up to date before checking it
+    self.stale = True
+    self.pool = pool
+    self.stale = stale
+
+  def _get(self, name: str) -> np.array:
+    if name not in self._cache:
+      self._cache[name] = self.data[name]
+    return self._cache[name]
+
+  def lookup(self, a_iri: str, config: str,
+             k: int = 10,
+             context: str = "P106",
+             magnitude_sort: bool = False,
+             a_classes: Optional[Iterable[str]] = None) -> Optional[List[Tuple[Sample, float]]]:
+    """
+    Retrieve the top-k B for an A entity.
+    The Bs excluded by the table are the ones sharing a class with A in the pool of B,
+    hence queries for A with other classes, e.g. retrieved from Wikidata, are not served.
+
+    Args:
+        a_iri (str): Wikidata IRI of A.
+        config (str): Configuration name, see ~config_key.
+        k (int, optional): Number of results. Defaults to 10.
+        context (str, optional): Predicate used as context C. Defaults to "P106".
+        magnitude_sort (bool, optional): Sort the results according to the magnitude
+          of their vectors, see ~AntonomasiaGenerator.top_k. Defaults to False.
+        a_classes (Optional[Iterable[str]], optional): Classifying features of A used by the query.
+          Defaults to None, i.e. the ones of A in the pool.
+
+    Returns:
+        Optional[List[Tuple[Sample, float]]]: The Bs together with their score, or None
+          if the table cannot answer the query and a live search is needed.
+    """
+    if self.stale or config not in self.configs or a_iri not in self.rows or k > self.k or context != self.context:
+      return None
+    if a_classes is not None and set(a_classes) != set(self.classes[a_iri].split("_")) - {""}:
+      return None
+
+    row = self.rows[a_iri]
+    idx = self._get(f"{config}_idx")[row, :k]
+    score = self._get(f"{config}_score")[row, :k]
+    valid = idx >= 0
+    if not valid.any():
+      return None
+    idx, score = idx[valid], score[valid]
+
+    if magnitude_sort:
+      order = np.argsort(self._get(f"{config}_magnitude")[idx])[::-1]
+      idx, score = idx[order], score[order]
+
+    pool = self.pool
+    iris = [str(self.iris[i]) for i in idx]
+    if any(iri not in pool for iri in iris):
+      # the pool changed since the table was built
+      return None
+    return [(pool[iri], float(s)) for iri, s in zip(iris, score)]
+
+
+def build_reverse_index(table_path: str, path: str):
+  """
+  Invert a table built by ~build_neighbour_table, so that the As whose
+  top-k contains a given B can be retrieved without scoring every A.
+  For each configuration, the As of all the Bs are stored in a single array
+  sorted by B and then by score, together with the offsets of every B.
+
+  Args:
+      table_path (str): Path to the neighbour table.
+      path (str): Output path of the index.
+  """
+  data = np.load(table_path)
+  iris, k = data["iris"], int(data["k"])
+  index = {}
+
+  for config in data["configs"]:
+    config = str(config)
+    idx, score = data[f"{config}_idx"], data[f"{config}_score"]
+    a = np.repeat(np.arange(len(iris), dtype=np.int32), k)
+    rank = np.tile(np.arange(k, dtype=np.int16), len(iris))
+    b, score = idx.reshape(-1), score.reshape(-1)
+    valid = b >= 0
+    a, b, rank, score = a[valid], b[valid], rank[valid], score[valid]
+
+    # best scores first: highest similarity or lowest distance
+    order = np.lexsort((score if config.endswith("_euclidean") else -score, b))
+    index[f"{config}_indptr"] = np.concatenate([[0], np.cumsum(np.bincount(b, minlength=len(iris)))]).astype(np.int64)
+    index[f"{config}_a"] = a[order]
+    index[f"{config}_rank"] = rank[order]
+    index[f"{config}_score"] = score[order]
+
+  if "classes" in data:
+    index["classes"] = data["classes"]
+  np.savez_compressed(path, iris=iris, k=data["k"], context=data["context"], configs=data["configs"], **index)
+
+
+class ReverseIndex(object):
+
+  def __init__(self, path: str, pool_of_b: List[Sample]):
+    """
+    Serve the As precomputed by ~build_reverse_index.
+
+    Args:
+        path (str): Path to the index.
+        pool_of_b (List[Sample]): Pool of B candidates used to resolve the stored IRIs.
+    """
+    self.data = np.load(path)
+    self.k = int(self.data["k"])
+    self.context = str(self.data["context"])
+    self.configs = set(str(c) for c in self.data["configs"])
+    self.iris = self.data["iris"]
+    self.rows = { str(iri): i for i, iri in enumerate(self.iris) }
+    self.classes = _stored_classes(self.data, self.iris)
+    self._cache = {}
+    self.stale = False
+    self.refresh(pool_of_b)
+
+  def refresh(self, pool_of_b: List[Sample]):
+    """
+    Follow an update of the pool of B.
+    Unlike ~NeighbourTable, any change makes the whole index stale: removing a
+    candidate moves the following ones into the top-k of other As.
+
+    Args:
+        pool_of_b (List[Sample]): Current pool of B candidates.
+    """
+    pool = { b.wikidata_iri: b for b in pool_of_b }
+    stale = len(pool) != len(self.rows) or _changed(pool, self.classes)
+    self.stale = True
+    self.pool = pool
+    self.stale = stale
+
+  def _get(self, name: str) -> np.array:
+    if name not in self._cache:
+      self._cache[name] = self.data[name]
+    return self._cache[name]
+
+  def lookup(self, b_iri: str, config: str,
+             k: int = 10,
+             context: str = "P106") -> Optional[List[Tuple[Sample, int, float]]]:
+    """
+    Retrieve the As that have B in their top-k.
+
+    Args:
+        b_iri (str): Wikidata IRI of B.
+        config (str): Configuration name, see ~config_key.
+        k (int, optional): Number of Bs generated for every A. Defaults to 10.
+        context (str, optional): Predicate used as context C. Defaults to "P106".
+
+    Returns:
+        Optional[List[Tuple[Sample, int, float]]]: The As together with the rank of B
+          among their results and its score, best scores first, or None if the index
+          cannot answer the query.
+    """
+    if self.stale or config not in self.configs or b_iri not in self.rows or k > self.k or context != self.context:
+      return None
+
+    row = self.rows[b_iri]
+    start, end = self._get(f"{config}_indptr")[row:row + 2]
+    a = self._get(f"{config}_a")[start:end]
+    rank = self._get(f"{config}_rank")[start:end]
+    score = self._get(f"{config}_score")[start:end]
+
+    pool = self.pool
+    return [(pool[str(self.iris[i])], int(r), float(s)) for i, r, s in zip(a, rank, score) if r < k]
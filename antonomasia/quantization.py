@@ -0,0 +1,90 @@
+from typing import Optional
+import numpy as np
+
+
+class QuantizedMatrix(object):
+
+  def __init__(self, matrix: np.array, dtype: str = "int8", chunk_size: int = 65536):
+    """
+    Store a matrix with a reduced precision.
+    Two storage types are supported: "float16", which halves the size of
+    a float32 matrix, and "int8", where every dimension is scaled to [-127, 127]
+    independently, which reduces a float32 matrix to a quarter of its size.
+    Rows are converted in chunks, so that no full precision copy is created.
+
+    Args:
+        matrix (np.array): Matrix to quantize, e.g. the entity embeddings of a KGE.
+        dtype (str, optional): Either "float16" or "int8". Defaults to "int8".
+        chunk_size (int, optional): Number of rows converted at once. Defaults to 65536.
+    """
+    if dtype not in ["float16", "int8"]:
+      raise ValueError(f"{dtype} is not a supported quantization type!")
+
+    self.dtype = dtype
+    self.source_dtype = matrix.dtype
+    self.shape = matrix.shape
+    self.scale = None
+
+    if dtype == "int8":
+      scale = np.zeros(matrix.shape[1], dtype=np.float32)
+      for i in range(0, len(matrix), chunk_size):
+        scale = np.maximum(scale, np.abs(matrix[i:i + chunk_size]).max(axis=0))
+      scale = scale / 127
+      scale[scale == 0] = 1
+      self.scale = scale.astype(np.float32)
+
+    self.data = np.empty(matrix.shape, dtype=np.float16 if dtype == "float16" else np.int8)
+    for i in range(0, len(matrix), chunk_size):
+      chunk = matrix[i:i + chunk_size]
+      if dtype == "int8":
+        chunk = np.clip(np.round(chunk / self.scale), -127, 127)
+      self.data[i:i + chunk_size] = chunk
+
+  def __len__(self) -> int:
+    return self.shape[0]
+
+  def __getitem__(self, idx) -> np.array:
+    """
+    Retrieve rows of the matrix, converted back to float32.
+
+    Args:
+        idx: Any numpy index over the rows.
+
+    Returns:
+        np.array: Dequantized rows.
+    """
+    rows = self.data[idx].astype(np.float32)
+    if self.scale is not None:
+      rows *= self.scale
+    return rows
+
+  @property
+  def nbytes(self) -> int:
+    """
+    Memory used by the quantized matrix.
+    """
+    return self.data.nbytes + (0 if self.scale is None else self.scale.nbytes)
+
+  @property
+  def source_nbytes(self) -> int:
+    """
+    Memory used by the original matrix.
+    """
+    return int(np.prod(self.shape)) * np.dtype(self.source_dtype).itemsize
+
+
+def quantize(matrix: np.array, dtype: Optional[str] = None):
+  """
+  Quantize a matrix if a quantization type is provided.
+
+  Args:
+      matrix (np.array): Matrix to quantize.
+      dtype (Optional[str], optional): Either "float16", "int8" or None to keep
+        the full precision. Defaults to None.
+
+  Returns:
+      The matrix itself or a ~QuantizedMatrix.
+  """
+  if dtype is None:
+    return matrix
+  return QuantizedMatrix(matrix, dtype)
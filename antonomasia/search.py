@@ -0,0 +1,504 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+from multiprocessing import Pool
+import os
+import warnings
+import numpy as np
+
+from antonomasia.embeddings import BaseEmbedding, KGE
+from antonomasia.generation import AntonomasiaGenerator
+from antonomasia.models import model_nbytes
+from antonomasia.quantization import QuantizedMatrix
+from antonomasia.utils import Sample, POOL_CLASSES
+
+_shard = {}
+
+
+class QuantizedSearch(object):
+
+  def __init__(self, generator: AntonomasiaGenerator,
+               dtype: str = "int8",
+               shortlist: int = 5,
+               chunk_size: int = 65536,
+               reference: Optional[str] = None):
+    """
+    Search the pool of B on quantized embeddings and re-rank a shortlist
+    of candidates in full precision.
+    Updates of the pool made after the initialisation are not reflected by the search.
+
+    The full precision rows of the shortlist are read from the reference, a .npy file
+    memory-mapped from disk, see ~export_reference. The embedding method of the generator,
+    e.g. a quantized KGE (see ~antonomasia.embeddings.KGE), then only has to embed the
+    As outside of the pool. Without a reference, the shortlist is embedded again by the
+    generator, which does not recover the precision lost by a quantized KGE.
+
+    Args:
+        generator (AntonomasiaGenerator): Generator providing the embedding method and the pool of B.
+        dtype (str, optional): Either "float16" or "int8". Defaults to "int8".
+        shortlist (int, optional): The shortlist holds shortlist * (k + 1) candidates. Defaults to 5.
+        chunk_size (int, optional): Number of rows dequantized at once. Defaults to 65536.
+        reference (Optional[str], optional): Path to the full precision embeddings of the pool,
+          one row per entry of the b_pool of the generator. Defaults to None.
+    """
+    self.generator = generator
+    self.emb = generator.emb
+    self.b_pool = generator.b_pool
+    self.shortlist = shortlist
+    self.chunk_size = chunk_size
+    self.reference = None
+    self.rows = {}
+
+    if reference is not None:
+      self.reference = np.load(reference, mmap_mode="r")
+      if len(self.reference) != len(self.b_pool):
+        raise ValueError(f"{reference} has {len(self.reference)} rows, but the pool has {len(self.b_pool)} entries")
+      self.rows = { b.wikidata_iri: i for i, b in enumerate(self.b_pool) }
+      source = self.reference
+    else:
+      source = np.stack([self.emb.embed_entity(b) for b in self.b_pool])
+    # the full precision matrix is only needed while quantizing
+    self.matrix = QuantizedMatrix(source, dtype)
+
+  @property
+  def nbytes(self) -> int:
+    """
+    Memory used by the quantized pool.
+    """
+    return self.matrix.nbytes
+
+  @property
+  def source_nbytes(self) -> int:
+    """
+    Memory used by the pool in full precision.
+    """
+    return self.matrix.source_nbytes
+
+  def similarity(self, a: np.array, c: np.array,
+                 projection: str = "translate",
+                 similarity_fn: str = "cosine") -> np.array:
+    """
+    Score a against the quantized pool, see ~AntonomasiaGenerator.context_similarity.
+
+    Args:
+        a (np.array): Embedding for a
+        c (np.array): Matrix with the embedding of one context per row.
+        projection (str, optional): Either "translate" or "project". Defaults to "translate".
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+    Returns:
+        np.array: Scores with shape (len(c), len(b_pool)).
+    """
+    return np.concatenate([
+      AntonomasiaGenerator.context_similarity(a, self.matrix[i:i + self.chunk_size], c, projection, similarity_fn)
+      for i in range(0, len(self.matrix), self.chunk_size)
+    ], axis=1)
+
+  def top_k_contexts(self, a: Sample, contexts: List[str],
+                     a_classes: Optional[Dict[str, List[str]]] = None,
+                     projection: str = "translate",
+                     k: int = 10,
+                     magnitude_sort: bool = False,
+                     similarity_fn: str = "cosine") -> Dict[str, List[Tuple[Sample, float]]]:
+    """
+    Approximate version of ~AntonomasiaGenerator.top_k_contexts.
+    The candidates are ranked on the quantized pool, then the best
+    shortlist * (k + 1) of them are embedded again with the reference embedding
+    and ranked in full precision.
+
+    Args:
+        a (Sample): Entity a sample
+        contexts (List[str]): Predicates for c.
+        a_classes (Optional[Dict[str, List[str]]], optional): Classifying features of a
+          for each context. Defaults to a.classes for every context.
+        projection (str, optional): Either "translate" or "project". Defaults to "translate".
+        k (int, optional): Number of top results per context. Defaults to 10.
+        magnitude_sort (bool, optional): See ~AntonomasiaGenerator.top_k. Defaults to False.
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+    Returns:
+        Dict[str, List[Tuple[Sample, float]]]: The Bs together with their score for each context.
+    """
+    a_emb = self.emb.embed_entity(a)
+    c_emb = np.stack([self.emb.embed_predicate(c) for c in contexts])
+
+    sim = self.similarity(a_emb, c_emb, projection, similarity_fn)
+    exclude = self.generator.exclusion_masks(a, contexts, a_classes, self.b_pool)
+    candidates, _ = AntonomasiaGenerator.rank_batch(sim, exclude, k=self.shortlist * (k + 1),
+                                                    similarity_fn=similarity_fn, skip_first=False)
+
+    if a.wikidata_iri in self.rows:
+      a_emb = np.asarray(self.reference[self.rows[a.wikidata_iri]])
+
+    results = {}
+    for i, c in enumerate(contexts):
+      candidates_i = candidates[i][candidates[i] >= 0]
+      if self.reference is not None:
+        b_emb = np.asarray(self.reference[candidates_i])
+      else:
+        b_emb = np.stack([self.emb.embed_entity(self.b_pool[j]) for j in candidates_i])
+      exact = AntonomasiaGenerator.context_similarity(a_emb, b_emb, c_emb[i:i + 1], projection, similarity_fn)
+      top_k, score = AntonomasiaGenerator.rank_batch(exact, np.zeros(exact.shape, dtype=bool), k=k,
+                                                     similarity_fn=similarity_fn)
+      valid = top_k[0] >= 0
+      top_k, score = top_k[0][valid], score[0][valid]
+      if magnitude_sort:
+        _, b = self.generator.transform_embeddings(a_emb, b_emb[top_k], c_emb[i], projection)
+        order = np.argsort(np.abs(b).sum(axis=1))[::-1]
+        top_k, score = top_k[order], score[order]
+      results[c] = [(self.b_pool[candidates_i[j]], float(s)) for j, s in zip(top_k, score)]
+    return results
+
+
+def exact_top_k(generator: AntonomasiaGenerator, a_samples: List[Sample],
+                context: str = "P106",
+                projection: str = "translate",
+                k: int = 10,
+                similarity_fn: str = "cosine") -> List[List[str]]:
+  """
+  Run the exact search of a generator for every A, see ~AntonomasiaGenerator.generate.
+
+  Args:
+      generator (AntonomasiaGenerator): Generator providing the exact search.
+      a_samples (List[Sample]): A entities used as queries.
+      context (str, optional): Predicate for c. Defaults to "P106".
+      projection (str, optional): Either "translate" or "project". Defaults to "translate".
+      k (int, optional): Number of top results. Defaults to 10.
+      similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+  Returns:
+      List[List[str]]: Wikidata IRIs of the top-k Bs of every A.
+  """
+  return [
+    [b.wikidata_iri for b, _ in generator.generate(a, context, projection=projection, k=k, similarity_fn=similarity_fn)]
+    for a in a_samples
+  ]
+
+
+def quantization_report(search: QuantizedSearch, a_samples: List[Sample],
+                        context: str = "P106",
+                        projection: str = "translate",
+                        k: int = 10,
+                        similarity_fn: str = "cosine",
+                        exact: Optional[List[List[str]]] = None) -> Dict[str, float]:
+  """
+  Compare a ~QuantizedSearch with an exact search.
+
+  Args:
+      search (QuantizedSearch): Quantized search to evaluate.
+      a_samples (List[Sample]): A entities used as queries.
+      context (str, optional): Predicate for c. Defaults to "P106".
+      projection (str, optional): Either "translate" or "project". Defaults to "translate".
+      k (int, optional): Number of top results. Defaults to 10.
+      similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+      exact (Optional[List[List[str]]], optional): Exact top-k of every A, see ~exact_top_k, e.g. computed
+        by a full precision generator which is released before the search is built.
+        Defaults to None, i.e. the exact search of the generator of the search.
+
+  Returns:
+      Dict[str, float]: Memory of the pool in full precision and quantized, the saved fraction,
+        the memory held by the embedding method and the quantized pool, the mean fraction
+        of the exact top-k retrieved and the fraction of identical rankings.
+  """
+  if exact is None:
+    exact = exact_top_k(search.generator, a_samples, context, projection, k, similarity_fn)
+  overlap, identical = [], []
+  for a, expected in zip(a_samples, exact):
+    approx = [b.wikidata_iri for b, _ in search.top_k_contexts(a, [context], projection=projection, k=k,
+                                                               similarity_fn=similarity_fn)[context]]
+    overlap.append(len(set(expected).intersection(approx)) / max(len(expected), 1))
+    identical.append(expected == approx)
+
+  return {
+    "full_bytes": search.source_nbytes,
+    "quantized_bytes": search.nbytes,
+    "saved": 1 - search.nbytes / search.source_nbytes,
+    "resident_bytes": model_nbytes(search.emb) + search.nbytes,
+    "agreement": float(np.mean(overlap)),
+    "identical": float(np.mean(identical)),
+  }
+
+
+def export_matrix(matrix, path: str, chunk_size: int = 65536):
+  """
+  Write a matrix to a .npy file that can be memory-mapped.
+
+  Args:
+      matrix: A numpy array or a ~QuantizedMatrix, which is stored dequantized.
+      path (str): Output path.
+      chunk_size (int, optional): Number of rows written at once. Defaults to 65536.
+  """
+  out = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=matrix.shape)
+  for i in range(0, len(matrix), chunk_size):
+    out[i:i + chunk_size] = matrix[i:i + chunk_size]
+  out.flush()
+  del out
+
+
+def export_reference(generator: AntonomasiaGenerator, path: str):
+  """
+  Write the full precision embeddings of the pool of a generator, used by ~QuantizedSearch
+  to re-rank the shortlist. The generator must be built on a full precision embedding method,
+  and can be released once the file is written.
+
+  Args:
+      generator (AntonomasiaGenerator): Generator providing the embedding method and the pool of B.
+      path (str): Output path of the .npy file.
+  """
+  export_matrix(generator.pool_embeddings(), path)
+
+
+def _init_shard_worker(path: str, allowed: Optional[np.array]):
+  # every worker uses a single core, the parallelism comes from the shards
+  from threadpoolctl import threadpool_limits
+  threadpool_limits(1)
+  _shard["matrix"] = np.load(path, mmap_mode="r")
+  _shard["allowed"] = allowed
+  _shard["norms"] = {}
+
+
+def _search_shard(task: tuple) -> Tuple[np.array, np.array]:
+  start, end, a, c, exclude, projection, similarity_fn, k, chunk_size = task
+  matrix, allowed, norms = _shard["matrix"], _shard["allowed"], _shard["norms"]
+
+  top_k, scores = [], []
+  for i in range(start, end, chunk_size):
+    j = min(i + chunk_size, end)
+    b = np.asarray(matrix[i:j])
+    if (i, j) not in norms:
+      norms[(i, j)] = np.einsum("ij,ij->i", b, b)
+    sim = AntonomasiaGenerator.context_similarity(a, b, c, projection, similarity_fn, b_norms=norms[(i, j)])
+
+    mask = np.zeros(sim.shape, dtype=bool)
+    if allowed is not None:
+      mask |= ~allowed[None, i:j]
+    for row, rows in enumerate(exclude):
+      lo, hi = np.searchsorted(rows, [i, j])
+      mask[row, rows[lo:hi] - i] = True
+
+    idx, score = AntonomasiaGenerator.rank_batch(sim, mask, k=k, similarity_fn=similarity_fn, skip_first=False)
+    top_k.append(np.where(idx >= 0, idx + i, -1))
+    scores.append(score)
+  return np.concatenate(top_k, axis=1), np.concatenate(scores, axis=1)
+
+
+class ShardedSearch(object):
+
+  def __init__(self, emb: BaseEmbedding, path: str, wikidata_iris: List[str],
+               classes: Optional[Dict[str, List[str]]] = None,
+               labels: Optional[Dict[str, str]] = None,
+               allowed: Optional[np.array] = None,
+               processes: Optional[int] = None,
+               shards: Optional[int] = None,
+               chunk_size: int = 65536,
+               resolve: Optional[Callable[[List[str], str], Dict[str, Sample]]] = None,
+               overfetch: int = 3,
+               max_resolved: int = 65536):
+    """
+    Search B among a large set of entities, e.g. all the Wikidata5M entities of a KGE.
+    The embeddings are memory-mapped from a .npy file and split in shards,
+    which are scored by a persistent pool of processes. Every worker returns
+    its local top-k and the results are merged by the caller.
+    See ~from_kge and ~from_generator to build the search.
+
+    The classes of most entities of a KGE are unknown, hence they cannot be excluded
+    while scoring. Given resolve, overfetch * k candidates are retrieved instead, the ones
+    with unknown classes are resolved with a single call per context, and those sharing
+    a class with A or that cannot be resolved are dropped, so that less than k Bs may be returned.
+    The known classes are the ones of the pool (see ~antonomasia.utils.POOL_CLASSES),
+    hence all the candidates are resolved along other contexts.
+
+    Args:
+        emb (BaseEmbedding): Embedding method used for A and C.
+        path (str): Path to the .npy file with one embedding per entity.
+        wikidata_iris (List[str]): Wikidata IRI of every row of the matrix.
+        classes (Optional[Dict[str, List[str]]], optional): Known classifying features
+          of the entities, used to exclude the Bs sharing a class with A. Defaults to None.
+        labels (Optional[Dict[str, str]], optional): Known labels of the entities. Defaults to None.
+        allowed (Optional[np.array], optional): Boolean mask over the rows, False for the
+          entities that cannot be used as B. Defaults to None.
+        processes (Optional[int], optional): Number of worker processes. Defaults to all cores.
+        shards (Optional[int], optional): Number of shards. Defaults to 4 per process.
+        chunk_size (int, optional): Number of rows scored at once by a worker. Defaults to 65536.
+        resolve (Optional[Callable[[List[str], str], Dict[str, Sample]]], optional): Retrieve the samples
+          of several entities for a context, e.g. ~antonomasia.utils.get_samples. Defaults to None,
+          i.e. the unknown entities are returned with their IRI as label and no class.
+        overfetch (int, optional): Candidates retrieved per result when resolve is given. Defaults to 3.
+        max_resolved (int, optional): Number of resolved samples kept for further queries. Defaults to 65536.
+    """
+    self.emb = emb
+    self.matrix = np.load(path, mmap_mode="r")
+    self.wikidata_iris = wikidata_iris
+    self.classes = classes or {}
+    self.labels = labels or {}
+    self.chunk_size = chunk_size
+    self.resolve = resolve
+    self.overfetch = overfetch
+    self.max_resolved = max_resolved
+    self.resolved = OrderedDict()
+
+    rows = { iri: i for i, iri in enumerate(wikidata_iris) }
+    class_rows = {}
+    for iri, cls in self.classes.items():
+      if iri in rows:
+        for c in cls:
+          class_rows.setdefault(c, []).append(rows[iri])
+    self.class_rows = { c: np.array(sorted(r), dtype=np.int64) for c, r in class_rows.items() }
+
+    processes = processes or os.cpu_count()
+    shards = shards or 4 * processes
+    bounds = np.linspace(0, len(self.matrix), shards + 1).astype(int)
+    self.shards = [(s, e) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+    self.pool = Pool(processes, initializer=_init_shard_worker, initargs=(path, allowed))
+
+  @classmethod
+  def from_kge(cls, kge: KGE, path: str, allowed_iris: Optional[Iterable[str]] = None, **kwargs) -> "ShardedSearch":
+    """
+    Search among all the entities of a KGE.
+    The entity matrix is exported to path if the file does not exist.
+
+    Args:
+        kge (KGE): Knowledge Graph Embedding method.
+        path (str): Path to the .npy file of the entity matrix.
+        allowed_iris (Optional[Iterable[str]], optional): Wikidata IRIs of the entities that can
+          be used as B, used to build the allowed mask. Defaults to None, i.e. all the entities.
+        kwargs: See ~ShardedSearch.
+
+    Returns:
+        ShardedSearch: The search.
+    """
+    if not os.path.exists(path):
+      export_matrix(kge.ee, path)
+    wikidata_iris = [kge.id2e[i] for i in range(len(kge.ee))]
+    if allowed_iris is not None:
+      allowed_iris = set(allowed_iris)
+      kwargs["allowed"] = np.array([iri in allowed_iris for iri in wikidata_iris], dtype=bool)
+    return cls(kge, path, wikidata_iris, **kwargs)
+
+  @classmethod
+  def from_generator(cls, generator: AntonomasiaGenerator, path: str, **kwargs) -> "ShardedSearch":
+    """
+    Search among the pool of B of a generator.
+    The pool matrix is exported to path.
+
+    Args:
+        generator (AntonomasiaGenerator): Generator providing the embedding method and the pool of B.
+        path (str): Path to the .npy file of the pool matrix.
+        kwargs: See ~ShardedSearch.
+
+    Returns:
+        ShardedSearch: The search.
+    """
+    # a single snapshot, so that the rows and the pool agree under concurrent updates
+    snap = generator.snapshot()
+    b_pool = [b for b, alive in zip(snap.b_pool, snap.alive) if alive]
+    export_matrix(snap.b_emb[snap.alive], path)
+    return cls(generator.emb, path, [b.wikidata_iri for b in b_pool],
+               classes={ b.wikidata_iri: b.classes for b in b_pool },
+               labels={ b.wikidata_iri: b.label for b in b_pool }, **kwargs)
+
+  def close(self):
+    """
+    Stop the worker processes.
+    """
+    self.pool.close()
+    self.pool.join()
+
+  def __enter__(self) -> "ShardedSearch":
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def top_k_contexts(self, a: Sample, contexts: List[str],
+                     a_classes: Optional[Dict[str, List[str]]] = None,
+                     projection: str = "translate",
+                     k: int = 10,
+                     magnitude_sort: bool = False,
+                     similarity_fn: str = "cosine") -> Dict[str, List[Tuple[Sample, float]]]:
+    """
+    Sharded version of ~AntonomasiaGenerator.top_k_contexts.
+
+    Args:
+        a (Sample): Entity a sample
+        contexts (List[str]): Predicates for c.
+        a_classes (Optional[Dict[str, List[str]]], optional): Classifying features of a
+          for each context. Defaults to a.classes for every context.
+        projection (str, optional): Either "translate" or "project". Defaults to "translate".
+        k (int, optional): Number of top results per context. Defaults to 10.
+        magnitude_sort (bool, optional): See ~AntonomasiaGenerator.top_k. Defaults to False.
+        similarity_fn (str, optional): Either "cosine" or "euclidean". Defaults to "cosine".
+
+    Returns:
+        Dict[str, List[Tuple[Sample, float]]]: The Bs together with their score for each context.
+    """
+    a_classes = a_classes or {}
+    a_emb = self.emb.embed_entity(a)
+    c_emb = np.stack([self.emb.embed_predicate(c) for c in contexts])
+
+    empty = np.zeros(0, dtype=np.int64)
+    exclude = []
+    for c in contexts:
+      # the known classes are the ones of the pool, other contexts are resolved after the scan
+      known = c == POOL_CLASSES or self.resolve is None
+      rows = [self.class_rows.get(cls, empty) for cls in a_classes.get(c, a.classes)] if known else []
+      exclude.append(np.unique(np.concatenate(rows)) if rows else empty)
+
+    fetch = k if self.resolve is None else self.overfetch * k
+    tasks = [(s, e, a_emb, c_emb, exclude, projection, similarity_fn, fetch + 1, self.chunk_size) for s, e in self.shards]
+    partial = self.pool.map(_search_shard, tasks)
+    candidates = np.concatenate([p[0] for p in partial], axis=1)
+    scores = np.concatenate([p[1] for p in partial], axis=1)
+    top_k, score = AntonomasiaGenerator.rank_batch(scores, candidates < 0, k=fetch, similarity_fn=similarity_fn)
+
+    results = {}
+    for i, c in enumerate(contexts):
+      valid = top_k[i] >= 0
+      idx, s = candidates[i][top_k[i][valid]], score[i][valid]
+      if self.resolve is not None:
+        samples = self._resolve(idx, c)
+        classes = set(a_classes.get(c, a.classes))
+        keep = [n for n, j in enumerate(idx) if j in samples and not classes.intersection(samples[j].classes)][:k]
+        idx, s = idx[keep], s[keep]
+      else:
+        samples = { j: self._sample(j) for j in idx }
+      if magnitude_sort:
+        _, b = AntonomasiaGenerator.transform_embeddings(a_emb, np.asarray(self.matrix[idx]), c_emb[i], projection)
+        order = np.argsort(np.abs(b).sum(axis=1))[::-1]
+        idx, s = idx[order], s[order]
+      results[c] = [(samples[j], float(v)) for j, v in zip(idx, s)]
+    return results
+
+  def _sample(self, row: int) -> Sample:
+    iri = self.wikidata_iris[row]
+    return Sample(iri, self.labels.get(iri, iri), self.classes.get(iri, []))
+
+  def _resolve(self, rows: np.array, context: str) -> Dict[int, Sample]:
+    """
+    Samples of the given rows, resolving the unknown entities with a single call.
+    Rows that cannot be resolved are left out.
+    """
+    samples, missing = {}, []
+    for j in rows:
+      iri = self.wikidata_iris[j]
+      if iri in self.labels and context == POOL_CLASSES:
+        samples[j] = self._sample(j)
+      elif (iri, context) in self.resolved:
+        self.resolved.move_to_end((iri, context))
+        samples[j] = self.resolved[(iri, context)]
+      else:
+        missing.append(j)
+    if not missing:
+      return samples
+
+    try:
+      found = self.resolve([self.wikidata_iris[j] for j in missing], context)
+    except Exception as e:
+      warnings.warn(f"Cannot resolve {len(missing)} candidates, they are left out: {type(e).__name__}: {e}")
+      found = {}
+    for j in missing:
+      iri = self.wikidata_iris[j]
+      if iri in found:
+        samples[j] = self.resolved[(iri, context)] = found[iri]
+    while len(self.resolved) > self.max_resolved:
+      self.resolved.popitem(last=False)
+    return samples
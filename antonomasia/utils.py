@@ -1,8 +1,36 @@
+from typing import Dict, List
 from collections import namedtuple
-from wikidata.client import Client
+import csv
 
 Sample = namedtuple("Sample", ["wikidata_iri", "label", "classes"])
-client = Client()
+_client = None
+
+# Classification property of the classes stored in the pool of B, i.e. the occupation
+POOL_CLASSES = "P106"
+
+SPARQL_ENDPOINT = "https://query.wikidata.org/bigdata/namespace/wdq/sparql"
+SAMPLES_QUERY = """
+SELECT ?item ?itemLabel ?classLabel WHERE {
+  VALUES ?item { %s }
+  FILTER EXISTS { ?item rdfs:label [] }
+  OPTIONAL { ?item wdt:%s ?class . }
+  SERVICE wikibase:label { bd:serviceParam wikibase:language "en". }
+}
+"""
+
+
+def get_client():
+  """
+  Retrieve the Wikidata client shared by the package, created on first use.
+
+  Returns:
+      Client: Wikidata client.
+  """
+  global _client
+  if _client is None:
+    from wikidata.client import Client
+    _client = Client()
+  return _client
 
 def get_sample(wikidata_iri: str, class_iri: str) -> Sample:
   """
@@ -15,8 +43,75 @@ def get_sample(wikidata_iri: str, class_iri: str) -> Sample:
   Returns:
       Sample: The built sample.
   """
+  client = get_client()
   a_entity = client.get(wikidata_iri, load=True)
   c_entity = client.get(class_iri, load=True)
   classes = set([str(e.label) for e in a_entity.getlist(c_entity)])
   return Sample(wikidata_iri, str(a_entity.label), classes)
-    
+
+
+def get_samples(wikidata_iris: List[str], class_iri: str) -> Dict[str, Sample]:
+  """
+  Retrieve several samples with a single query to the Wikidata SPARQL endpoint,
+  see ~get_sample.
+
+  Args:
+      wikidata_iris (List[str]): IRIs of the Wikidata entities.
+      class_iri (str): IRI of the classification property.
+
+  Returns:
+      Dict[str, Sample]: The built samples indexed by their IRI, entities missing
+        from Wikidata are left out.
+  """
+  from SPARQLWrapper import SPARQLWrapper, JSON
+
+  sparql = SPARQLWrapper(SPARQL_ENDPOINT)
+  sparql.setReturnFormat(JSON)
+  sparql.setQuery(SAMPLES_QUERY % (" ".join(f"wd:{iri}" for iri in wikidata_iris), class_iri))
+  bindings = sparql.queryAndConvert()["results"]["bindings"]
+
+  samples = {}
+  for row in bindings:
+    iri = row["item"]["value"].split("/")[-1]
+    label, classes = samples.get(iri, (row["itemLabel"]["value"], set()))
+    if "classLabel" in row:
+      classes.add(row["classLabel"]["value"])
+    samples[iri] = (label, classes)
+  return { iri: Sample(iri, label, classes) for iri, (label, classes) in samples.items() }
+
+
+def get_classes(wikidata_iri: str, class_iris: List[str]) -> Dict[str, set]:
+  """
+  Retrieve the classes of an entity along several classification properties.
+  An empty set means that the entity has no value for the property: it cannot
+  be used as context, since no sentence can be verbalized along it.
+
+  Args:
+      wikidata_iri (str): IRI of the Wikidata entity.
+      class_iris (List[str]): IRIs of the classification properties.
+
+  Returns:
+      Dict[str, set]: Labels of the classes for each classification property.
+  """
+  client = get_client()
+  a_entity = client.get(wikidata_iri, load=True)
+  classes = {}
+  for class_iri in class_iris:
+    c_entity = client.get(class_iri, load=True)
+    classes[class_iri] = set([str(e.label) for e in a_entity.getlist(c_entity)])
+  return classes
+
+
+def load_pool(path: str) -> List[Sample]:
+  """
+  Read the pool of B from its csv file.
+
+  Args:
+      path (str): Path to the csv file, e.g. data/pool_of_b.csv.
+
+  Returns:
+      List[Sample]: The B candidates.
+  """
+  with open(path, "r", encoding="utf-8") as csvfile:
+    csv_reader = csv.reader(csvfile)
+    return [Sample(row[0].split("/")[-1], row[1], row[-1].split("_")) for row in csv_reader]
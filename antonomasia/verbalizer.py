@@ -1,4 +1,3 @@
-from antonomasia.embeddings import KGE
 from wikidata.client import Client
 
 from antonomasia.utils import Sample
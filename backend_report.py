@@ -0,0 +1,82 @@
+import argparse
+import os
+import shutil
+import tempfile
+
+from antonomasia.evaluation import evaluate_backends
+from antonomasia.generation import AntonomasiaGenerator
+from antonomasia.models import METHODS, load_models
+from antonomasia.neighbours import NeighbourTable, config_key
+from antonomasia.search import QuantizedSearch, ShardedSearch
+from antonomasia.utils import get_sample, get_samples, load_pool
+from experiments import set_of_a
+
+BACKENDS = ["contexts", "float16", "int8", "sharded", "table"]
+
+argparser = argparse.ArgumentParser(description="Compare the speed and quality of the search backends with the exact search")
+argparser.add_argument("-b", "--b_pool", required=True, help="Path to the file containing the csv for the set of B entities.")
+argparser.add_argument("-kge", required=True, help="Path to the KGE weigths.")
+argparser.add_argument("-m", "--method", default="kge", choices=METHODS, help="Embedding method to evaluate.")
+argparser.add_argument("--backends", nargs="+", default=["contexts", "float16", "int8", "sharded"], choices=BACKENDS,
+                       help="Backends to compare with the exact search.")
+argparser.add_argument("--table", default=None, help="Path to the neighbour table, required by the table backend.")
+argparser.add_argument("--processes", default=None, type=int, help="Number of processes of the sharded backend, defaults to all cores.")
+argparser.add_argument("--shortlist", default=5, type=int, help="Size of the re-ranked shortlist of the quantized backends, as a multiple of k + 1.")
+argparser.add_argument("-n", default=200, type=int, help="Number of pool entities used as A, 0 for the whole pool.")
+argparser.add_argument("--extra", nargs="*", default=set_of_a, help="Further A entities expressed as Wikidata IDs, defaults to the ones of experiments.py.")
+argparser.add_argument("-k", default=10, type=int, help="Number of top results.")
+argparser.add_argument("-p", "--projection", default="translate", choices=["translate", "project"], help="Projection method to use.")
+argparser.add_argument("--distance", default="cosine", choices=["cosine", "euclidean"], help="Vector distance to use.")
+argparser.add_argument("--context", default="P106", help="Wikidata ID of the context predicate.")
+
+
+if __name__ == "__main__":
+    args = argparser.parse_args()
+    if "table" in args.backends and args.table is None:
+        argparser.error("the table backend requires --table")
+
+    pool_of_b = load_pool(args.b_pool)
+    emb = load_models(args.kge, [args.method])[args.method]
+    generator = AntonomasiaGenerator(emb, pool_of_b, resolve=get_samples)
+
+    a_samples = generator.b_pool if args.n == 0 else generator.b_pool[:args.n]
+    extra = [get_sample(a, args.context) for a in args.extra]
+    a_samples = a_samples + [a for a in extra if a in emb]
+
+    params = {"projection": args.projection, "similarity_fn": args.distance}
+    exact = lambda a, c, k: generator.generate(a, c, k=k, **params)
+    backends, nbytes = {}, {"exact": generator.snapshot().b_emb.nbytes}
+    closing = []
+
+    if "contexts" in args.backends:
+        backends["contexts"] = lambda a, c, k: generator.top_k_contexts(a, [c], k=k, **params)[c]
+        nbytes["contexts"] = nbytes["exact"]
+    for dtype in ["float16", "int8"]:
+        if dtype in args.backends:
+            search = QuantizedSearch(generator, dtype, shortlist=args.shortlist)
+            backends[dtype] = lambda a, c, k, search=search: search.top_k_contexts(a, [c], k=k, **params)[c]
+            nbytes[dtype] = search.nbytes
+    if "sharded" in args.backends:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "pool.npy")
+        sharded = ShardedSearch.from_generator(generator, path, processes=args.processes)
+        closing += [sharded.close, lambda: shutil.rmtree(directory)]
+        backends["sharded"] = lambda a, c, k: sharded.top_k_contexts(a, [c], k=k, **params)[c]
+        nbytes["sharded"] = os.path.getsize(path)
+    if "table" in args.backends:
+        table = NeighbourTable(args.table, pool_of_b)
+        config = config_key(args.method, args.projection, args.distance)
+        backends["table"] = lambda a, c, k: table.lookup(a.wikidata_iri, config, k=k, context=c)
+        nbytes["table"] = sum(table.data[f"{config}_{name}"].nbytes for name in ["idx", "score", "magnitude"])
+
+    try:
+        report = evaluate_backends(exact, backends, a_samples, context=args.context, k=args.k, nbytes=nbytes)
+    finally:
+        for close in closing:
+            close()
+
+    print(f"{len(a_samples)} A entities, {len(generator.b_pool)} B candidates, k={args.k}")
+    print(f"{'backend':<10} {'recall':>7} {'rank corr':>9} {'coverage':>8} {'p50 ms':>8} {'p99 ms':>8} {'held MiB':>9} {'peak MiB':>9}")
+    for name, r in report.items():
+        print(f"{name:<10} {r['recall']:>7.3f} {r['rank_correlation']:>9.3f} {r['coverage']:>8.1%} "
+              f"{r['p50'] * 1e3:>8.2f} {r['p99'] * 1e3:>8.2f} {r['nbytes'] / 2**20:>9.2f} {r['peak_bytes'] / 2**20:>9.2f}")
@@ -28,19 +28,20 @@ method = {
   }
 }
 
-for a in set_of_a:
-  for d in ["cosine", "euclidean"]:
-    cmd = f"python antonomasia.py -b data/pool_of_b.csv -a {a} --distance {d} "
-    for m, params in method.items():
-      method_cmd = f"{cmd} {m}"
-      combs = product(*params.values())
-      for comb in combs:
-        filename = f"{a}_{m}_{d}_" + "_".join(comb)
-        filename = filename.replace("/", "_")
-        filename = filename.replace(".", "")
-        filename += ".txt"
-        comb = " ".join(flatten(zip(params.keys(), comb)))
+if __name__ == "__main__":
+  for a in set_of_a:
+    for d in ["cosine", "euclidean"]:
+      cmd = f"python antonomasia.py -b data/pool_of_b.csv -a {a} --distance {d} "
+      for m, params in method.items():
+        method_cmd = f"{cmd} {m}"
+        combs = product(*params.values())
+        for comb in combs:
+          filename = f"{a}_{m}_{d}_" + "_".join(comb)
+          filename = filename.replace("/", "_")
+          filename = filename.replace(".", "")
+          filename += ".txt"
+          comb = " ".join(flatten(zip(params.keys(), comb)))
         
-        final_cmd = f"{method_cmd} {comb} > output/{filename}"
-        print(final_cmd)
-        subprocess.call(final_cmd, shell=True)
+          final_cmd = f"{method_cmd} {comb} > output/{filename}"
+          print(final_cmd)
+          subprocess.call(final_cmd, shell=True)
@@ -0,0 +1,25 @@
+import argparse
+
+from antonomasia.models import METHODS, load_models
+from antonomasia.neighbours import build_neighbour_table, build_reverse_index
+from antonomasia.utils import load_pool
+
+argparser = argparse.ArgumentParser(description="Precompute the top-k B for every entity in the pool of B")
+argparser.add_argument("-b", "--b_pool", required=True, help="Path to the file containing the csv for the set of B entities.")
+argparser.add_argument("-kge", required=True, help="Path to the KGE weigths.")
+argparser.add_argument("-o", "--output", default="data/neighbours.npz", help="Path of the generated table.")
+argparser.add_argument("-k", default=10, type=int, help="Number of neighbours to store for each entity.")
+argparser.add_argument("--methods", nargs="+", default=METHODS, choices=METHODS, help="Embedding methods to precompute.")
+argparser.add_argument("--reverse", default=None, help="Path of the reverse index, listing the As of every B, built from the table.")
+argparser.add_argument("--processes", default=None, type=int, help="Number of worker processes, defaults to all cores.")
+
+
+if __name__ == "__main__":
+    args = argparser.parse_args()
+
+    pool_of_b = load_pool(args.b_pool)
+
+    models = load_models(args.kge, args.methods)
+    build_neighbour_table(models, pool_of_b, args.output, k=args.k, processes=args.processes)
+    if args.reverse is not None:
+        build_reverse_index(args.output, args.reverse)
@@ -0,0 +1,62 @@
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+
+from antonomasia.cache import get_cache
+from antonomasia.generation import AntonomasiaGenerator
+from antonomasia.models import METHODS, load_models, model_nbytes
+from antonomasia.search import QuantizedSearch, exact_top_k, export_reference, quantization_report
+from antonomasia.utils import load_pool
+
+argparser = argparse.ArgumentParser(description="Compare quantized and exact search of the pool of B")
+argparser.add_argument("-b", "--b_pool", required=True, help="Path to the file containing the csv for the set of B entities.")
+argparser.add_argument("-kge", required=True, help="Path to the KGE weigths.")
+argparser.add_argument("-m", "--method", default="kge", choices=METHODS, help="Embedding method to evaluate.")
+argparser.add_argument("--dtype", default="int8", choices=["float16", "int8"], help="Quantization of the pool.")
+argparser.add_argument("--kge-dtype", default=None, choices=["float16", "int8"], help="Quantization of the KGE entity embeddings held in memory.")
+argparser.add_argument("--reference", default=None, help="Path where the full precision embeddings of the pool are written for the re-rank, defaults to a temporary file.")
+argparser.add_argument("--shortlist", default=5, type=int, help="Size of the re-ranked shortlist, as a multiple of k + 1.")
+argparser.add_argument("-n", default=100, type=int, help="Number of pool entities used as A.")
+argparser.add_argument("-k", default=10, type=int, help="Number of top results.")
+argparser.add_argument("-p", "--projection", default="translate", choices=["translate", "project"], help="Projection method to use.")
+argparser.add_argument("--distance", default="cosine", choices=["cosine", "euclidean"], help="Vector distance to use.")
+
+
+if __name__ == "__main__":
+    args = argparser.parse_args()
+
+    pool_of_b = load_pool(args.b_pool)
+
+    params = {"projection": args.projection, "k": args.k, "similarity_fn": args.distance}
+    directory = tempfile.mkdtemp() if args.reference is None else None
+    reference = args.reference or os.path.join(directory, "reference.npy")
+
+    # the full precision model is only held while running the exact search and writing the
+    # reference, so that the quantized search runs with the quantized model alone in memory
+    full = load_models(args.kge, [args.method])[args.method]
+    exact_generator = AntonomasiaGenerator(full, pool_of_b)
+    a_samples = exact_generator.b_pool[:args.n]
+    exact = exact_top_k(exact_generator, a_samples, **params)
+    full_bytes = model_nbytes(full) + exact_generator.pool_embeddings().nbytes
+    export_reference(exact_generator, reference)
+    if args.kge_dtype is not None:
+        del full, exact_generator
+        get_cache().clear()
+        gc.collect()
+        full = load_models(args.kge, [args.method], kge_dtype=args.kge_dtype)[args.method]
+
+    try:
+        search = QuantizedSearch(AntonomasiaGenerator(full, pool_of_b), args.dtype, shortlist=args.shortlist,
+                                 reference=reference)
+        report = quantization_report(search, a_samples, exact=exact, **params)
+    finally:
+        if directory is not None:
+            shutil.rmtree(directory)
+
+    print(f"Pool of B: {report['full_bytes'] / 2**20:.1f} MiB -> {report['quantized_bytes'] / 2**20:.1f} MiB "
+          f"({report['saved']:.1%} saved)")
+    print(f"Model and pool in memory: {full_bytes / 2**20:.1f} MiB -> {report['resident_bytes'] / 2**20:.1f} MiB, "
+          f"the shortlist is re-ranked from the memory-mapped pool")
+    print(f"Top-{args.k} agreement: {report['agreement']:.3f}, identical rankings: {report['identical']:.3f}")
@@ -0,0 +1,116 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Arguments of every subcommand of antonomasia.py. Model paths are never opened.
+SUBCOMMANDS = {
+    "kge": ["kge", "-i", "transe.pkl", "-p", "translate"],
+    "we": ["we", "-m", "word2vec", "-p", "translate"],
+    "meta": ["meta", "-kge", "transe.pkl", "-we", "word2vec", "-p", "translate", "-c", "concatenate"],
+}
+
+# Modules imported when the models of a subcommand are loaded
+BACKEND_IMPORTS = {
+    "kge": ["pickle"],
+    "we": ["gensim.downloader"],
+    "meta": ["pickle", "gensim.downloader"],
+}
+
+# Modules that a subcommand must not import before doing any work
+FORBIDDEN = {
+    "kge": ["gensim", "sklearn"],
+    "we": ["sklearn"],
+    "meta": ["sklearn"],
+}
+
+# Import time budget of every subcommand, in milliseconds
+BUDGETS = {
+    "kge": 400,
+    "we": 3000,
+    "meta": 3000,
+}
+
+STARTUP = """
+import runpy, sys
+sys.argv = {argv!r}
+cli = runpy.run_path("antonomasia.py", run_name="startup")
+cli["argparser"].parse_args(sys.argv[1:])
+for module in {imports!r}:
+  __import__(module)
+"""
+
+argparser = argparse.ArgumentParser(description="Measure the startup time of every subcommand of antonomasia.py")
+argparser.add_argument("--subcommands", nargs="+", default=list(SUBCOMMANDS), choices=list(SUBCOMMANDS), help="Subcommands to measure.")
+argparser.add_argument("--repeat", default=5, type=int, help="Number of runs per subcommand, the median is reported.")
+argparser.add_argument("--budget", nargs="+", default=[], help="Override a budget, e.g. kge=300.")
+argparser.add_argument("--top", default=5, type=int, help="Number of slowest imports to report.")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    Parse the output of python -X importtime.
+
+    Args:
+            stderr (str): Standard error of the process.
+
+    Returns:
+            dict: Cumulative import time in microseconds of every top-level import.
+    """
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nested imports are indented, their time is part of the cumulative time of the parent
+        if not name[1:].startswith(" "):
+            imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def measure(subcommand: str) -> dict:
+    argv = ["antonomasia.py", "-b", "data/pool_of_b.csv", "-a", "Q1"] + SUBCOMMANDS[subcommand]
+    code = STARTUP.format(argv=argv, imports=BACKEND_IMPORTS[subcommand])
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr)
+
+    imports = parse_importtime(process.stderr)
+    return {
+        "wall": wall * 1000,
+        "imports": sum(imports.values()) / 1000,
+        "modules": imports,
+        "all": set(line.split("|")[-1].strip() for line in process.stderr.splitlines() if line.startswith("import time:")),
+    }
+
+
+if __name__ == "__main__":
+    args = argparser.parse_args()
+    budgets = dict(BUDGETS)
+    for b in args.budget:
+        subcommand, ms = b.split("=")
+        budgets[subcommand] = float(ms)
+
+    failed = False
+    for subcommand in args.subcommands:
+        runs = [measure(subcommand) for _ in range(args.repeat)]
+        imports = statistics.median(r["imports"] for r in runs)
+        wall = statistics.median(r["wall"] for r in runs)
+        forbidden = sorted(m for m in runs[0]["all"] if m.split(".")[0] in FORBIDDEN[subcommand])
+        over = imports > budgets[subcommand]
+        failed |= over or bool(forbidden)
+
+        status = "FAIL" if over or forbidden else "ok"
+        print(f"{subcommand}: imports {imports:.0f} ms (budget {budgets[subcommand]:.0f} ms), wall {wall:.0f} ms [{status}]")
+        slowest = sorted(runs[0]["modules"].items(), key=lambda x: x[1], reverse=True)[:args.top]
+        for module, us in slowest:
+            print(f"  {us / 1000:8.1f} ms  {module}")
+        if forbidden:
+            print(f"  forbidden imports: {', '.join(forbidden)}")
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from antonomasia.generation import AntonomasiaGenerator
+from antonomasia.utils import Sample
+
+
+@pytest.mark.parametrize("projection", ["translate", "project"])
+@pytest.mark.parametrize("similarity_fn", ["cosine", "euclidean"])
+def test_context_similarity_matches_transform(projection, similarity_fn):
+  rng = np.random.default_rng(0)
+  a = rng.normal(size=16)
+  b = rng.normal(size=(50, 16))
+  c = rng.normal(size=(3, 16))
+
+  sim = AntonomasiaGenerator.context_similarity(a, b, c, projection, similarity_fn)
+
+  assert sim.shape == (len(c), len(b))
+  for i in range(len(c)):
+    a_t, b_t = AntonomasiaGenerator.transform_embeddings(a, b, c[i], projection)
+    if similarity_fn == "cosine":
+      expected = b_t @ a_t / (np.linalg.norm(b_t, axis=1) * np.linalg.norm(a_t))
+    else:
+      expected = np.linalg.norm(b_t - a_t, axis=1)
+    np.testing.assert_allclose(sim[i], expected, rtol=1e-6, atol=1e-8)
+
+
+@pytest.mark.parametrize("projection", ["translate", "project"])
+@pytest.mark.parametrize("similarity_fn", ["cosine", "euclidean"])
+def test_context_similarity_with_precomputed_norms(projection, similarity_fn):
+  rng = np.random.default_rng(1)
+  a, b, c = rng.normal(size=8), rng.normal(size=(20, 8)), rng.normal(size=(2, 8))
+
+  norms = np.einsum("ij,ij->i", b, b)
+  np.testing.assert_allclose(
+    AntonomasiaGenerator.context_similarity(a, b, c, projection, similarity_fn, b_norms=norms),
+    AntonomasiaGenerator.context_similarity(a, b, c, projection, similarity_fn))
+
+
+class StubEmbedding(object):
+  name = "stub"
+
+  def __init__(self, dim: int = 16):
+    self.rng = np.random.default_rng(2)
+    self.vectors = {}
+    self.dim = dim
+
+  def __contains__(self, s) -> bool:
+    return True
+
+  def _vector(self, key: str) -> np.array:
+    if key not in self.vectors:
+      self.vectors[key] = self.rng.normal(size=self.dim)
+    return self.vectors[key]
+
+  def embed_entity(self, s) -> np.array:
+    return self._vector(s.wikidata_iri)
+
+  def embed_predicate(self, s: str) -> np.array:
+    return self._vector(s)
+
+
+@pytest.mark.parametrize("projection", ["translate", "project"])
+@pytest.mark.parametrize("similarity_fn", ["cosine", "euclidean"])
+def test_top_k_contexts_matches_generate(projection, similarity_fn):
+  pool = [Sample(f"Q{i}", f"entity {i}", [f"class {i % 7}"]) for i in range(200)]
+  generator = AntonomasiaGenerator(StubEmbedding(), pool)
+  contexts = ["P106", "P101"]
+
+  for a in pool[:10]:
+    results = generator.top_k_contexts(a, contexts, projection=projection, k=5, similarity_fn=similarity_fn)
+    for c in contexts:
+      expected = generator.generate(a, c, projection=projection, k=5, similarity_fn=similarity_fn)
+      assert [b.wikidata_iri for b, _ in results[c]] == [b.wikidata_iri for b, _ in expected]
+      np.testing.assert_allclose([s for _, s in results[c]], [s for _, s in expected], rtol=1e-6)
@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional, Tuple
+from multiprocessing import Pool
+import ast
+import os
+import pickle
+import pandas as pd
+
+DIMENSIONS = ["fit", "original", "understand"]
+FILES = ["samples", "ents", "knows_ents"] + [f"ratings_{d}" for d in DIMENSIONS]
+FAMILIARITY = {
+  "I know who that person is.": 2,
+  "I have heard of the name but I cannot relate it to anything.": 1,
+  "I have never heard of that name before.": 0,
+}
+CATEGORIES = ["participant", "sentence", "config", "seed", "method", "distance", "projection", "dimension", "a", "b", "c"]
+CACHE_VERSION = 1
+
+
+def parse_config(config: str) -> Tuple[str, str, str, str]:
+  """
+  Split the name of the model configuration that generated a sentence,
+  e.g. Q937_kge_cosine_data_transe_wikidata5mpkl_projec.
+
+  Args:
+      config (str): Name of the configuration.
+
+  Returns:
+      Tuple[str, str, str, str]: Seed entity, method, distance and projection,
+        empty for the sentences written by ChatGPT.
+  """
+  if "chatgpt" in config.lower():
+    return "", "chatgpt", "", ""
+
+  splitted = config.split("_")
+  if len(splitted) == 5:
+    seed, _, distance, method, projection = splitted
+  elif len(splitted) == 7:
+    seed, _, distance, _, method, _, projection = splitted
+  elif len(splitted) == 9:
+    seed, _, distance, _, kge, _, we, combination, projection = splitted
+    method = f"{kge}_{we}_{combination}"
+  else:
+    raise ValueError(f"{config} is not a known model configuration!")
+
+  if projection == "projec":
+    projection = "project"
+  return seed, method, distance, projection
+
+
+def participant_files(directory: str) -> Dict[str, Dict[str, str]]:
+  """
+  Group the csv files of the directory by participant.
+
+  Returns:
+      Dict[str, Dict[str, str]]: Path of every file of each participant, by kind of file.
+  """
+  files = {}
+  for name in sorted(os.listdir(directory)):
+    participant, _, kind = name.partition("_")
+    kind = kind[:-len(".csv")]
+    if name.endswith(".csv") and kind in FILES:
+      files.setdefault(participant, {})[kind] = os.path.join(directory, name)
+  return files
+
+
+def read_participant(participant: str, files: Dict[str, str]) -> pd.DataFrame:
+  """
+  Read the ratings of a participant as one row per sentence and rating dimension.
+
+  Args:
+      participant (str): Id of the participant.
+      files (Dict[str, str]): Path of the files of the participant, see ~participant_files.
+
+  Returns:
+      pd.DataFrame: The ratings, empty if the participant did not rate any sentence.
+  """
+  # the rows of the samples and of the entities are in the same order
+  entities = {}
+  if "samples" in files and "ents" in files:
+    samples, ents = pd.read_csv(files["samples"]), pd.read_csv(files["ents"])
+    for sentence, config, a, b, c in zip(samples.Sentence, samples.Model, ents.A, ents.B, ents.C):
+      entities[(sentence, config)] = (a, b, c)
+
+  familiarity = {}
+  if "knows_ents" in files:
+    knows = pd.read_csv(files["knows_ents"])
+    familiarity = { ent: FAMILIARITY.get(answer) for ent, answer in knows.iloc[0, 2:].items() }
+
+  rows = []
+  for dimension in DIMENSIONS:
+    if f"ratings_{dimension}" not in files:
+      continue
+    ratings = pd.read_csv(files[f"ratings_{dimension}"])
+    for column, score in ratings.iloc[0, 2:].items():
+      sentence, config = ast.literal_eval(column)
+      a, b, c = entities.get((sentence, config), (None, None, None))
+      rows.append((participant, sentence, config, *parse_config(config), dimension, int(score),
+                   a, b, c, familiarity.get(a), familiarity.get(b)))
+
+  return pd.DataFrame(rows, columns=["participant", "sentence", "config", "seed", "method", "distance", "projection",
+                                     "dimension", "score", "a", "b", "c", "knows_a", "knows_b"])
+
+
+def _read(args) -> Tuple[str, pd.DataFrame]:
+  participant, files = args
+  return participant, read_participant(participant, files)
+
+
+def _signature(files: Dict[str, str]) -> Tuple:
+  return tuple(sorted((kind, os.stat(path).st_mtime_ns, os.stat(path).st_size) for kind, path in files.items()))
+
+
+def load_ratings(directory: str = "data", cache: Optional[str] = None, processes: Optional[int] = None) -> pd.DataFrame:
+  """
+  Load the ratings of every participant as a long table, with one row per
+  participant, sentence and rating dimension.
+  The table of every participant is cached, and only the participants whose
+  files were added or changed since the last call are read again, in parallel.
+
+  Args:
+      directory (str, optional): Directory with the csv files of the user evaluation. Defaults to "data".
+      cache (Optional[str], optional): Path to the cache. Defaults to ".ratings.pkl" in the directory.
+      processes (Optional[int], optional): Number of processes reading the files, defaults to all cores.
+
+  Returns:
+      pd.DataFrame: The ratings, with categorical columns for the participant, sentence,
+        model configuration (also split into seed, method, distance and projection),
+        rating dimension and entities, the integer score, and the familiarity of the
+        participant with A and B (0 to 2).
+  """
+  cache = cache or os.path.join(directory, ".ratings.pkl")
+  cached = {}
+  if os.path.exists(cache):
+    with open(cache, "rb") as f:
+      content = pickle.load(f)
+    if content.get("version") == CACHE_VERSION:
+      cached = content["participants"]
+
+  files = participant_files(directory)
+  signatures = { participant: _signature(fs) for participant, fs in files.items() }
+  stale = [(participant, fs) for participant, fs in files.items()
+           if participant not in cached or cached[participant][0] != signatures[participant]]
+
+  fresh = set(participant for participant, _ in stale)
+  tables = { participant: cached[participant] for participant in files if participant not in fresh }
+  if len(stale) > 1:
+    with Pool(processes) as pool:
+      read = pool.imap_unordered(_read, stale, chunksize=max(1, len(stale) // (4 * (processes or os.cpu_count()))))
+      tables.update({ participant: (signatures[participant], df) for participant, df in read })
+  else:
+    tables.update({ participant: (signatures[participant], df) for participant, df in map(_read, stale) })
+
+  if stale or len(tables) != len(cached):
+    with open(cache, "wb") as f:
+      pickle.dump({"version": CACHE_VERSION, "participants": tables}, f)
+
+  # participants who left the study before rating have an empty table
+  ratings = pd.concat([read_participant("", {})] + [tables[p][1] for p in sorted(tables) if len(tables[p][1])],
+                      ignore_index=True)
+  for column in CATEGORIES:
+    ratings[column] = ratings[column].astype("category")
+  ratings["score"] = ratings["score"].astype("int8")
+  ratings["knows_a"] = ratings["knows_a"].astype("Int8")
+  ratings["knows_b"] = ratings["knows_b"].astype("Int8")
+  return ratings
+
+
+def model_summary(ratings: pd.DataFrame, by: List[str] = ["method", "projection"]) -> pd.DataFrame:
+  """
+  Mean score of each model configuration on every rating dimension.
+
+  Args:
+      ratings (pd.DataFrame): Ratings loaded with ~load_ratings.
+      by (List[str], optional): Columns identifying a configuration. Defaults to ["method", "projection"].
+
+  Returns:
+      pd.DataFrame: One row per configuration and one column per dimension.
+  """
+  return ratings.pivot_table(index=by, columns="dimension", values="score", aggfunc="mean", observed=True)
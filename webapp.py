@@ -1,11 +1,12 @@
+import os
 import re
 
 import streamlit as st
-import csv
 from antonomasia.embeddings import KGE, WordEmbedding, MetaEmbedding
 from antonomasia.generation import AntonomasiaGenerator
 from antonomasia.verbalizer import Verbalizer
-from antonomasia.utils import Sample
+from antonomasia.neighbours import NeighbourTable, ReverseIndex, config_key
+from antonomasia.utils import get_classes, get_samples, load_pool
 from SPARQLWrapper import SPARQLWrapper, JSON
 from streamlit_extras.add_vertical_space import add_vertical_space
 from style import write_footer, hide_menu_style, custom_style
@@ -54,9 +55,7 @@ write_footer()
 if "loaded" not in st.session_state:
   st.session_state["loaded"] = False
 
-with open("data/pool_of_b.csv", "r", encoding="utf-8") as csvfile:
-    csv_reader = csv.reader(csvfile)
-    pool_of_b = [Sample(row[0].split("/")[-1], row[1], row[-1].split("_")) for row in csv_reader]
+pool_of_b = load_pool("data/pool_of_b.csv")
 
 
 def parse_sentence(sentence):
@@ -87,12 +86,43 @@ def load_models():
     }
 
 
+@st.cache_resource
+def load_table():
+    if os.path.exists("data/neighbours.npz"):
+        return NeighbourTable("data/neighbours.npz", pool_of_b)
+    return None
+
+
+@st.cache_resource
+def load_reverse():
+    if os.path.exists("data/reverse.npz"):
+        return ReverseIndex("data/reverse.npz", pool_of_b)
+    return None
+
+
+@st.cache_data
+def load_classes(wikidata_iri, contexts):
+    return get_classes(wikidata_iri, list(contexts))
+
+
+@st.cache_data
+def load_sentence(a, b, context):
+    return verb.generate_sentence(a, b, context)
+
+
+@st.cache_resource
+def load_generator(method):
+    return AntonomasiaGenerator(models[method], pool_of_b, resolve=get_samples)
+
+
 # placeholder_info = st.empty()
 # if st.session_state["loaded"] is False:
 #     placeholder_info = st.info("It make take some time to load the models. We appreciate your patience.")
 # if st.session_state["loaded"] is True:
 #     placeholder_info.empty()
 models = load_models()
+table = load_table()
+reverse = load_reverse()
 
 
 method_model_map = {
@@ -105,35 +135,57 @@ method_model_map = {
     "meta_glove_average": "Meta embedding: KGE and GloVe average",
 }
 
-tab_gen, tab_config = st.tabs(["Generation", "Configuration"])
+context_map = {
+    "P106": "Occupation",
+    "P101": "Field of work",
+    "P136": "Genre",
+}
+
+tab_gen, tab_reverse, tab_config = st.tabs(["Generation", "Reverse lookup", "Configuration"])
 
 with tab_config:
     method = st.selectbox("Select the method", list(method_model_map.keys()), format_func=method_model_map.get)
     projection_method = st.radio("Embedding search method", ("translate", "project"))
     distance = st.radio("Distance function", ("cosine", "euclidean"))
     creative_sort = st.checkbox("Most creative first", True)
+    contexts = st.multiselect("Context", list(context_map.keys()), default=["P106"], format_func=context_map.get)
+    if not contexts:
+        contexts = ["P106"]
 
 with tab_gen:
     select_a = st.selectbox("Select the A entity", pool_of_b, format_func=lambda s: s.label, index=2162)
     k = st.number_input("Number of sentences to generate", min_value=1, max_value=10, value=1, step=1)
 
-    generator = AntonomasiaGenerator(models[method], pool_of_b)
     verb = Verbalizer()
     profession_pred = "P106"
 
-    a_emb, b_emb, b_ids, c_emb = generator.embed_a_b_c(select_a, profession_pred)
-
-    if projection_method == "translate":
-        a, b = generator.translate_embeddings(a_emb, b_emb, c_emb)
-    else:
-        a, b = generator.project_embeddings(a_emb, b_emb, c_emb)
-
-    top_k, sim = generator.top_k(a, b, k=k, similarity_fn=distance, magnitude_sort=creative_sort)
+    # the classes of the pool are professions, other contexts are looked up
+    a_classes = {profession_pred: select_a.classes}
+    others = tuple(c for c in contexts if c != profession_pred)
+    if others:
+        a_classes.update(load_classes(select_a.wikidata_iri, others))
+    missing = [c for c in contexts if not a_classes[c]]
+    if missing:
+        st.info(f"{select_a.label} has no {' or '.join(context_map[c].lower() for c in missing)}, "
+                "hence no sentence can be generated along it.")
+    contexts = [c for c in contexts if a_classes[c]]
+
+    results = [] if not contexts else None
+    if table is not None and contexts == [profession_pred]:
+        found = table.lookup(select_a.wikidata_iri, config_key(method, projection_method, distance),
+                             k=k, context=profession_pred, magnitude_sort=creative_sort)
+        if found is not None:
+            results = [(b, conf, profession_pred) for b, conf in found]
+
+    if results is None:
+        generator = load_generator(method)
+        found = generator.top_k_contexts(select_a, contexts, a_classes, projection=projection_method, k=k,
+                                         magnitude_sort=creative_sort, similarity_fn=distance)
+        results = [(b, conf, c) for c in contexts for b, conf in found[c]]
 
     pbar = st.progress(0, text="Generating the sentences...")
-    for i, (idx, conf) in enumerate(zip(top_k, sim)):
-        b = b_ids[idx]
-        sentence = verb.generate_sentence(select_a, b, profession_pred)
+    for i, (b, conf, context) in enumerate(results):
+        sentence = verb.generate_sentence(select_a, b, context)
         parsed = parse_sentence(sentence)
 
         #A = sentence.split(" is")[0] if "is the" in sentence else sentence.split(" was")[0]
@@ -171,4 +223,30 @@ with tab_gen:
             if 0 <= conf <= 1:
                 st.progress(float(conf), text=f"Confidence {conf:0.2f}")
 
-        pbar.progress((i + 1) / len(top_k), text="Generating the sentences...")
+        pbar.progress((i + 1) / len(results), text="Generating the sentences...")
+
+with tab_reverse:
+    if reverse is None:
+        st.info("The reverse lookup needs an index, built with precompute.py --reverse data/reverse.npz")
+    else:
+        select_b = st.selectbox("Select the B entity", pool_of_b, format_func=lambda s: s.label, index=2162)
+        k_reverse = st.number_input("Number of sentences generated for every A", min_value=1, max_value=10,
+                                    value=10, step=1)
+        found = reverse.lookup(select_b.wikidata_iri, config_key(method, projection_method, distance),
+                               k=k_reverse, context=profession_pred)
+        if found is None:
+            st.info("The index is out of date, it has to be rebuilt with precompute.py")
+        elif not found:
+            st.info(f"{select_b.label} is not among the suggestions of any entity")
+        else:
+            # listing the As only reads the index, the sentences query Wikidata
+            for a, rank, conf in found:
+                st.markdown(f"[{a.label}](https://www.wikidata.org/wiki/{a.wikidata_iri}): "
+                            f"suggestion {rank + 1}, score {conf:0.3f}")
+            if st.button(f"Generate the sentences for {len(found)} entities"):
+                for a, rank, conf in found:
+                    try:
+                        st.markdown(f"[{a.label}](https://www.wikidata.org/wiki/{a.wikidata_iri}): "
+                                    f"{load_sentence(a, select_b, profession_pred)}")
+                    except Exception as e:
+                        st.warning(f"No sentence can be generated for {a.label}: {e}")